@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Benchmark of the single-pass GCWerks reader against the previous
+# approach of four np.genfromtxt calls (one per column group).
+# Run from the repository root: python benchmarks/benchmark_gcwerks_reader.py
+# *********************************************************************
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import datetime as dt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import gcwerks_reader
+
+
+def write_synthetic_gcwerks(datapath, nrows, seed=0):
+    """ Write a synthetic space-delimited GCWerks 20-min file
+    inputs:
+        datapath (str): output path
+        nrows (int): number of data rows
+        seed (int): random seed
+    """
+    rng = np.random.RandomState(seed)
+    values = rng.normal(size=(nrows, 30))
+    types = np.array(['air', 'D334212', 'D334213', 'D671527', 'D671528'])
+    sample_type = types[rng.randint(0, len(types), nrows)]
+    t0 = dt.datetime(2018, 1, 1)
+    with open(datapath, 'w') as handle:
+        handle.write('GCWerks 20-min record\n')
+        handle.write(' '.join(['col%d' % i for i in range(30)])+'\n')
+        for i in range(nrows):
+            t = t0+dt.timedelta(minutes=20*i)
+            row = ['%.4f' % v for v in values[i]]
+            row[2] = t.strftime('%y%m%d')
+            row[3] = t.strftime('%H%M')
+            row[5] = sample_type[i]
+            handle.write(' '.join(row)+'\n')
+
+
+def read_genfromtxt(gcwerks_datapath):
+    """ Previous per-column-group approach (processing_icl_measurements)
+    """
+    date, time, air_type = np.genfromtxt(gcwerks_datapath, unpack=True, usecols=(2,3,5),
+                                         delimiter='', dtype=str, skip_header=2)
+    d13ch4_c, d13ch4_c_stdev = np.genfromtxt(gcwerks_datapath, unpack=True, usecols=(11,14),
+                                             delimiter='', skip_header=2)
+    _12ch4_c, _12ch4_c_stdev = np.genfromtxt(gcwerks_datapath, unpack=True, usecols=(21,24),
+                                             delimiter='', skip_header=2)
+    h2o = np.genfromtxt(gcwerks_datapath, unpack=True, usecols=(10), delimiter='', skip_header=2)
+    return {'date': date, 'time': time, 'air_type': air_type, 'h2o': h2o,
+            'd13ch4_c': d13ch4_c, 'd13ch4_c_stdev': d13ch4_c_stdev,
+            '12ch4_c': _12ch4_c, '12ch4_c_stdev': _12ch4_c_stdev}
+
+
+def best_of(func, repeats, *args, **kwargs):
+    """ Best wall-clock time of repeated calls
+    """
+    timings = []
+    for _ in range(repeats):
+        t_start = time.perf_counter()
+        out = func(*args, **kwargs)
+        timings.append(time.perf_counter()-t_start)
+    return min(timings), out
+
+
+def main():
+    nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    columns = ['date', 'time', 'air_type', 'h2o', 'd13ch4_c', 'd13ch4_c_stdev',
+               '12ch4_c', '12ch4_c_stdev']
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datapath = os.path.join(tmpdir, '20min_record.txt')
+        write_synthetic_gcwerks(datapath, nrows)
+
+        t_old, old = best_of(read_genfromtxt, 3, datapath)
+        t_new, new = best_of(gcwerks_reader.read_gcwerks, 3, datapath,
+                             layout='space', columns=columns)
+
+    for name in columns:
+        values = new[name]
+        if name+'_categories' in new:
+            values = new[name+'_categories'][values]
+        assert np.array_equal(old[name], values), name
+
+    print('rows: %d' % nrows)
+    print('np.genfromtxt x4 : %.3f s' % t_old)
+    print('read_gcwerks     : %.3f s' % t_new)
+    print('speedup          : %.1fx' % (t_old/t_new))
+
+if __name__=="__main__":
+    main()
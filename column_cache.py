@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Binary cache for columns parsed from text data files.
+# Each source file gets a cache directory holding one .npy file per
+# column plus a manifest recording the source path, size and mtime.
+# Columns are loaded memory-mapped; the entry is rebuilt whenever the
+# source file changes.
+# *********************************************************************
+
+import os
+import json
+import hashlib
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'icl_measurements')
+
+MANIFEST = 'manifest.json'
+
+
+def source_stamp(datapath):
+    """ Identity of a source file: absolute path, size and mtime
+    """
+    stat = os.stat(datapath)
+    return {'path': os.path.abspath(datapath),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+
+
+def entry_dir(cache_dir, datapath, tag=''):
+    """ Cache directory for a source file (and parser tag, e.g. a layout)
+    """
+    key = hashlib.sha1((os.path.abspath(datapath)+'|'+tag).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key)
+
+
+def load_columns(cache_dir, datapath, tag='', mmap_mode='r'):
+    """ Load cached columns for a source file
+    inputs:
+        cache_dir (str): root cache directory
+        datapath (str): path to the source file
+        tag (str): parser tag the columns were stored under
+        mmap_mode (str): np.load mmap mode (None to read into memory)
+
+    returns:
+        data (dict): column name -> np.array, or None if the cache is
+                     missing or stale
+    """
+    entry = entry_dir(cache_dir, datapath, tag)
+    try:
+        with open(os.path.join(entry, MANIFEST), 'r') as handle:
+            manifest = json.load(handle)
+    except (IOError, ValueError):
+        return None
+    if manifest['source']!=source_stamp(datapath):
+        return None
+
+    data = {}
+    for name in manifest['columns']:
+        try:
+            data[name] = np.load(os.path.join(entry, name+'.npy'), mmap_mode=mmap_mode)
+        except IOError:
+            return None
+    return data
+
+
+def save_columns(cache_dir, datapath, data, tag='', stamp=None):
+    """ Store parsed columns for a source file
+    inputs:
+        cache_dir (str): root cache directory
+        datapath (str): path to the source file
+        data (dict): column name -> np.array
+        tag (str): parser tag to store the columns under
+        stamp (dict): source_stamp taken before parsing (default: now)
+    """
+    if stamp is None:
+        stamp = source_stamp(datapath)
+    entry = entry_dir(cache_dir, datapath, tag)
+    if not os.path.isdir(entry):
+        os.makedirs(entry)
+    manifest_path = os.path.join(entry, MANIFEST)
+#   Invalidate the entry before touching any column file
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for name, values in data.items():
+        tmp_path = os.path.join(entry, name+'.tmp.npy')
+        np.save(tmp_path, np.asarray(values))
+        os.replace(tmp_path, os.path.join(entry, name+'.npy'))
+
+    manifest = {'source': stamp, 'columns': list(data)}
+    with open(manifest_path+'.tmp', 'w') as handle:
+        json.dump(manifest, handle)
+    os.replace(manifest_path+'.tmp', manifest_path)
+
+
+def cached_columns(cache_dir, datapath, loader, tag=''):
+    """ Return cached columns, parsing the source file only on a miss
+    inputs:
+        cache_dir (str): root cache directory
+        datapath (str): path to the source file
+        loader (function): loader(datapath) -> dict of columns
+        tag (str): parser tag to store the columns under
+
+    returns:
+        data (dict): column name -> np.array (memory-mapped on a hit)
+    """
+    data = load_columns(cache_dir, datapath, tag)
+    if data is None:
+        stamp = source_stamp(datapath)
+        data = loader(datapath)
+        save_columns(cache_dir, datapath, data, tag, stamp=stamp)
+    return data
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Compact in-memory records (dicts of equal length 1D arrays with a
+# 'time' key).
+# - compact: datetime64[m] time and optional float32 storage
+# - masked_views: subsets (e.g. 13:00-17:00) as masked arrays that
+#   share the record's data and one mask, instead of NaN-filled copies
+# - memory_footprint: bytes held by a record, shared buffers counted once
+# *********************************************************************
+
+import numpy as np
+
+
+def compact(record, float32=False):
+    """ Record with datetime64[m] time and, optionally, float32 values
+    Arrays that already have the target type are not copied.
+    inputs:
+        record (dict): variable -> 1D array, including 'time'
+        float32 (bool): store float variables as float32 (~7 significant
+                        digits, enough for 20-min means)
+
+    returns:
+        record (dict): compacted record
+    """
+    out = {}
+    for key, values in record.items():
+        if key=='time':
+            out[key] = np.asarray(values, dtype='datetime64[m]')
+        elif float32 and np.asarray(values).dtype.kind=='f':
+            out[key] = values.astype(np.float32, copy=False)
+        else:
+            out[key] = values
+    return out
+
+
+def masked_views(record, keep, names):
+    """ Masked views of record variables, hidden where keep is False
+    The views share the record's data (writing to one writes to the
+    record) and all share a single mask array.
+    inputs:
+        record (dict): variable -> 1D array
+        keep (np.array): boolean, True for the elements to show
+        names (dict): view name -> record variable (e.g. {'ch4_day': 'ch4'})
+
+    returns:
+        views (dict): view name -> np.ma.MaskedArray
+    """
+    hidden = ~np.asarray(keep, dtype=bool)
+    views = {}
+    for name, variable in names.items():
+        views[name] = np.ma.MaskedArray(record[variable], mask=hidden, copy=False)
+    return views
+
+
+def _buffers(values):
+    """ Underlying arrays (data, and mask for masked arrays) of a variable
+    """
+    arrays = [np.ma.getdata(values)]
+    if np.ma.isMaskedArray(values) and values.mask is not np.ma.nomask:
+        arrays.append(values.mask)
+    bases = []
+    for array in arrays:
+        while isinstance(array, np.ndarray) and isinstance(array.base, np.ndarray):
+            array = array.base
+        bases.append(array)
+    return bases
+
+
+def memory_footprint(record):
+    """ Memory held by a record
+    Views (e.g. from masked_views) add nothing for data they share.
+    inputs:
+        record (dict): variable -> array
+
+    returns:
+        footprint (dict): 'variables' (variable -> bytes of its own
+                          elements) and 'total' (bytes of all distinct
+                          underlying buffers)
+    """
+    variables = {}
+    seen = {}
+    for key, values in record.items():
+        variables[key] = np.ma.getdata(values).nbytes
+        if np.ma.isMaskedArray(values) and values.mask is not np.ma.nomask:
+            variables[key] += values.mask.nbytes
+        for base in _buffers(values):
+            seen[id(base)] = np.asarray(base).nbytes
+    return {'variables': variables, 'total': sum(seen.values())}
+
+
+def format_footprint(footprint):
+    """ Text report of a memory_footprint
+    """
+    lines = ['%-20s %10.2f MB' % (key, nbytes/1e6) for key, nbytes in footprint['variables'].items()]
+    lines.append('%-20s %10.2f MB (shared buffers counted once)' % ('total', footprint['total']/1e6))
+    return '\n'.join(lines)
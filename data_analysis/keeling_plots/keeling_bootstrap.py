@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Bootstrap uncertainties of Keeling / Miller-Tans source signatures
+# for many windows of the regular 20-min grid (e.g. one per afternoon).
+# - Resamples are drawn as one (n_boot, window) index array per window
+#   and every resample of a chunk of windows is fitted at once.
+# - Chunks of windows are spread over a process pool.
+# - Each window draws from its own generator, spawned from
+#   SeedSequence(seed), so results do not depend on the number of
+#   workers or the chunk size.
+# *********************************************************************
+
+import sys
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append('//')
+import record_store
+import keeling_regression
+import york_regression
+
+
+def _window_variables(conc, delta, conc_stdev, delta_stdev, window, step, first, method):
+    if method=='keeling':
+        variables = york_regression.keeling_variables(conc, delta, conc_stdev, delta_stdev)
+    elif method=='miller_tans':
+        variables = york_regression.miller_tans_variables(conc, delta, conc_stdev, delta_stdev)
+    else:
+        raise ValueError('Unknown method: %s' % method)
+    views = []
+    for values in variables:
+        values = np.broadcast_to(np.asarray(values, dtype=float), np.shape(conc))
+        starts, view = york_regression.window_matrix(values, window, step, first)
+        views.append(view)
+    return starts, views
+
+
+def _fit(x, y, sx, sy, r, weighted, min_points):
+    """ OLS or York fits along the last axis (NaN points left out)
+    """
+    if weighted:
+        return york_regression.york_fit(x, y, sx, sy, r, min_points=min_points)
+    valid = np.isfinite(x) & np.isfinite(y)
+    n = np.maximum(valid.sum(axis=-1), 1)[..., None]
+    x0 = np.where(valid, x, 0.).sum(axis=-1)[..., None]/n
+    y0 = np.where(valid, y, 0.).sum(axis=-1)[..., None]/n
+    xs = np.where(valid, x-x0, 0.)
+    ys = np.where(valid, y-y0, 0.)
+    sums = {'n': valid.sum(axis=-1).astype(float), 'sx': xs.sum(axis=-1), 'sy': ys.sum(axis=-1),
+            'sxx': (xs*xs).sum(axis=-1), 'sxy': (xs*ys).sum(axis=-1), 'syy': (ys*ys).sum(axis=-1)}
+    return keeling_regression.fit_from_sums(sums, x0[..., 0], y0[..., 0], min_points)
+
+
+def _bootstrap_chunk(views, seeds, n_boot, source, weighted, min_points, percentiles):
+    """ Bootstrap a chunk of windows (runs in a worker process)
+    """
+    x, y, sx, sy, r = [np.ascontiguousarray(v) for v in views]
+    nwin, window = x.shape
+    valid = np.isfinite(x) & np.isfinite(y)
+    if weighted:
+        valid &= (sx>0) & (sy>0)
+    n = valid.sum(axis=1)
+
+#     Move each window's valid points to the front, then draw indices < n
+    order = np.argsort(~valid, axis=1, kind='mergesort')
+    rows = np.arange(nwin)[:, None]
+    x, y, sx, sy, r = [v[rows, order] for v in (x, y, sx, sy, r)]
+    idx = np.zeros((nwin, n_boot, window), dtype=np.int64)
+    for i in range(nwin):
+        if n[i]>=min_points:
+            idx[i] = np.random.default_rng(seeds[i]).integers(0, n[i], size=(n_boot, window))
+    drawn = np.arange(window)<n[:, None, None]
+
+    rows = np.arange(nwin)[:, None, None]
+    bx = np.where(drawn, x[rows, idx], np.nan)
+    by, bsx, bsy, br = [v[rows, idx] for v in (y, sx, sy, r)]
+    boot = _fit(bx, by, bsx, bsy, br, weighted, min_points)[source]
+
+#     Degenerate resamples (e.g. one point drawn every time) are NaN and left out
+    out = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        out['boot_mean'] = np.nanmean(boot, axis=1)
+        out['boot_stdev'] = np.nanstd(boot, axis=1, ddof=1)
+        for q in percentiles:
+            out['p%g' % q] = np.nanpercentile(boot, q, axis=1)
+    return out
+
+
+def bootstrap_windows(conc, delta, conc_stdev, delta_stdev, window, step=1, first=0,
+                      method='keeling', weighted=False, n_boot=1000, seed=0,
+                      workers=1, chunk_windows=64, min_points=5, percentiles=(2.5, 50, 97.5)):
+    """ Bootstrap source signatures of every window of a regular grid
+    inputs:
+        conc, delta (np.array): gridded concentration and isotope ratio, NaN where missing
+        conc_stdev, delta_stdev (np.array): gridded 1 sigma uncertainties
+                                            (only used if weighted)
+        window, step, first (int): windows (grid slots, see york_regression.window_matrix);
+                                   daily 13-17 on a 20-min grid: 12, 72, 39
+        method (str): 'keeling' (source = intercept) or 'miller_tans' (source = slope)
+        weighted (bool): York fits instead of ordinary least squares
+        n_boot (int): resamples per window
+        seed (int): seed for SeedSequence; window i uses its i-th spawned child
+        workers (int): worker processes (1: run in this process)
+        chunk_windows (int): windows fitted together in one task
+        min_points (int): minimum number of points per window
+        percentiles (tuple): percentiles of the bootstrap distribution (0-100)
+
+    returns:
+        results (dict): 'start' (first slot), 'source' and 'source_stdev' (fit of
+                        the window itself), 'boot_mean', 'boot_stdev' and
+                        'p<q>' for each percentile q
+    """
+    source = 'intercept' if method=='keeling' else 'slope'
+    starts, views = _window_variables(conc, delta, conc_stdev, delta_stdev, window, step, first, method)
+    fit = _fit(*(views+[weighted, min_points]))
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+
+    chunks = [slice(i, i+chunk_windows) for i in range(0, len(starts), chunk_windows)]
+    tasks = [([v[c] for v in views], seeds[c], n_boot, source, weighted, min_points, percentiles)
+             for c in chunks]
+    if workers==1:
+        parts = [_bootstrap_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_bootstrap_chunk, *zip(*tasks)))
+
+    results = {'start': starts, 'source': fit[source], 'source_stdev': fit[source+'_stdev']}
+    for key in ['boot_mean', 'boot_stdev']+['p%g' % q for q in percentiles]:
+        results[key] = np.concatenate([part[key] for part in parts]) if parts else np.array([])
+    return results
+
+
+def main():
+#   Daily 13:00-17:00 bootstrap of the Keeling intercept on the 20-min CH4 grid
+    keeling_data = record_store.load_record('icl_ch4_keelingplot_data.h5')
+    results = bootstrap_windows(keeling_data['ch4'], keeling_data['d13ch4'],
+                                keeling_data['ch4_stdev'], keeling_data['d13ch4_stdev'],
+                                window=12, step=72, first=39, n_boot=1000, seed=0, workers=4)
+    results['time'] = keeling_data['time'][results.pop('start')].astype('datetime64[D]')
+    record_store.save_record('icl_ch4_keeling_bootstrap_daily.h5', results)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Batch Keeling plot (d13CH4 vs 1/CH4) regression over many windows of
+# the regular 20-min grid from keeling_plot_data_processing.
+# Window sums of 1, x, y, x^2, xy and y^2 are taken from cumulative
+# sums, so fitting every daily or sliding N-hour window costs O(N)
+# rather than O(N x window). The intercept is the source d13CH4.
+# *********************************************************************
+
+import sys
+import numpy as np
+
+sys.path.append('//')
+import record_store
+
+
+def window_sums(x, y, window, step=1, first=0):
+    """ Sums over windows of a regular grid from cumulative sums
+    Points where x or y is NaN are left out. x and y are shifted by
+    their overall means (x0, y0) before summing, which keeps the
+    cumulative sums well conditioned.
+    inputs:
+        x, y (np.array): gridded values
+        window (int): window length (grid slots)
+        step (int): slots between consecutive window starts
+        first (int): slot of the first window start
+
+    returns:
+        starts (np.array): first slot of each window
+        sums (dict): 'n', 'sx', 'sy', 'sxx', 'sxy', 'syy' per window
+        x0, y0 (float): shifts applied to x and y
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x0 = x[valid].mean() if np.any(valid) else 0.
+    y0 = y[valid].mean() if np.any(valid) else 0.
+    xs = np.where(valid, x-x0, 0.)
+    ys = np.where(valid, y-y0, 0.)
+
+    starts = np.arange(first, len(x)-window+1, step)
+    terms = {'n': valid.astype(float), 'sx': xs, 'sy': ys,
+             'sxx': xs*xs, 'sxy': xs*ys, 'syy': ys*ys}
+    sums = {}
+    for name, term in terms.items():
+        cumulative = np.concatenate([[0.], np.cumsum(term)])
+        sums[name] = cumulative[starts+window]-cumulative[starts]
+    return starts, sums, x0, y0
+
+
+def fit_from_sums(sums, x0=0., y0=0., min_points=3):
+    """ Ordinary least squares y = a + b*x for every window from its sums
+    inputs:
+        sums (dict): window sums from window_sums
+        x0, y0 (float): shifts applied to x and y
+        min_points (int): windows with fewer points are NaN
+
+    returns:
+        fit (dict): 'intercept', 'intercept_stdev', 'slope', 'slope_stdev',
+                    'r2' and 'n' per window
+    """
+    n = sums['n']
+    ok = n>=max(min_points, 3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xm = sums['sx']/n
+        ym = sums['sy']/n
+        sxx = sums['sxx']-n*xm*xm
+        sxy = sums['sxy']-n*xm*ym
+        syy = sums['syy']-n*ym*ym
+        ok &= sxx>0
+
+        slope = sxy/sxx
+        intercept = ym-slope*xm
+        resid_var = np.maximum(syy-slope*sxy, 0.)/(n-2)
+        slope_stdev = np.sqrt(resid_var/sxx)
+        intercept_stdev = np.sqrt(resid_var*(1./n+(xm+x0)**2/sxx))
+        r2 = sxy*sxy/(sxx*syy)
+
+#   Back to unshifted coordinates: y = (intercept + y0 - slope*x0) + slope*x
+    fit = {'intercept': intercept+y0-slope*x0,
+           'intercept_stdev': intercept_stdev,
+           'slope': slope,
+           'slope_stdev': slope_stdev,
+           'r2': r2,
+           'n': n}
+    for name in fit:
+        if name!='n':
+            fit[name] = np.where(ok, fit[name], np.nan)
+    return fit
+
+
+def rolling_keeling(times, ch4, d13ch4, window_hours, step_hours=None, min_points=5, step_minutes=20):
+    """ Keeling intercepts for sliding windows of a regular grid
+    inputs:
+        times (np.array): datetime64 grid times (regular spacing)
+        ch4 (np.array): gridded CH4 (ppb), NaN where missing
+        d13ch4 (np.array): gridded d13CH4 (permil), NaN where missing
+        window_hours (float): window length (hours)
+        step_hours (float): time between window starts (default: one slot)
+        min_points (int): minimum number of points per window
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        fit (dict): 'time' (window start) plus the fit_from_sums outputs
+    """
+    window = int(round(window_hours*60./step_minutes))
+    step = 1 if step_hours is None else int(round(step_hours*60./step_minutes))
+    with np.errstate(divide='ignore'):
+        x = 1./np.asarray(ch4, dtype=float)
+    starts, sums, x0, y0 = window_sums(x, d13ch4, window, step)
+    fit = fit_from_sums(sums, x0, y0, min_points)
+    fit['time'] = np.asarray(times)[starts]
+    return fit
+
+
+def daily_keeling(times, ch4, d13ch4, start_hour=0, end_hour=24, min_points=5, step_minutes=20):
+    """ Keeling intercept for each day, using slots in [start_hour, end_hour)
+    The grid must start at midnight (as from keeling_plot_data_processing).
+    inputs:
+        times (np.array): datetime64 grid times (regular spacing)
+        ch4 (np.array): gridded CH4 (ppb), NaN where missing
+        d13ch4 (np.array): gridded d13CH4 (permil), NaN where missing
+        start_hour, end_hour (float): time-of-day window (e.g. 13-17)
+        min_points (int): minimum number of points per day
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        fit (dict): 'time' (day) plus the fit_from_sums outputs
+    """
+    slots_per_day = 1440//step_minutes
+    first = int(np.ceil(start_hour*60./step_minutes))
+    window = int(np.ceil(end_hour*60./step_minutes))-first
+    with np.errstate(divide='ignore'):
+        x = 1./np.asarray(ch4, dtype=float)
+    starts, sums, x0, y0 = window_sums(x, d13ch4, window, step=slots_per_day, first=first)
+    fit = fit_from_sums(sums, x0, y0, min_points)
+    fit['time'] = np.asarray(times, dtype='datetime64[m]')[starts].astype('datetime64[D]')
+    return fit
+
+
+def main():
+#   Daily 13:00-17:00 Keeling intercepts from the regular 20-min grid
+    keeling_data = record_store.load_record('icl_ch4_keelingplot_data.h5')
+    fit = daily_keeling(keeling_data['time'], keeling_data['ch4'], keeling_data['d13ch4'],
+                        start_hour=13, end_hour=17)
+    record_store.save_record('icl_ch4_keeling_daily.h5', fit)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Error-weighted (York et al., 2004) straight line fits of many
+# Keeling or Miller-Tans windows at once, using the per-point
+# concentration and isotope uncertainties (e.g. ch4_stdev and
+# d13ch4_stdev). Works for any species (CH4/d13CH4, CO2/d13CO2).
+# - Keeling:     delta vs 1/c,     source signature = intercept
+# - Miller-Tans: delta*c vs c,     source signature = slope
+# Windows are rows of a strided (nwin, window) view of the grid and all
+# rows are iterated together.
+# *********************************************************************
+
+import sys
+import numpy as np
+
+sys.path.append('//')
+import record_store
+
+
+def window_matrix(values, window, step=1, first=0):
+    """ Strided (nwin, window) view of a 1D grid (no data copied)
+    inputs:
+        values (np.array): 1D gridded values
+        window (int): window length (grid slots)
+        step (int): slots between consecutive window starts
+        first (int): slot of the first window start
+
+    returns:
+        starts (np.array): first slot of each window
+        view (np.array): row i is values[starts[i]:starts[i]+window]
+    """
+    values = np.ascontiguousarray(values, dtype=float)
+    starts = np.arange(first, len(values)-window+1, step)
+    stride = values.strides[0]
+    view = np.lib.stride_tricks.as_strided(values[first:], shape=(len(starts), window),
+                                           strides=(step*stride, stride), writeable=False)
+    return starts, view
+
+
+def york_fit(x, y, sx, sy, r=0., min_points=3, max_iter=50, tol=1e-10):
+    """ York regression y = a + b*x along the last axis
+    Points with a NaN value or a non-positive uncertainty are left out.
+    inputs:
+        x, y (np.array): (..., npoints) data
+        sx, sy (np.array): 1 sigma uncertainties of x and y
+        r (float/np.array): correlation of the x and y errors
+        min_points (int): fits with fewer points are NaN
+        max_iter (int): maximum number of slope iterations
+        tol (float): relative slope change for convergence
+
+    returns:
+        fit (dict): 'intercept', 'intercept_stdev', 'slope', 'slope_stdev',
+                    'mswd' (reduced chi-squared) and 'n' per fit
+    """
+    x, y, sx, sy, r = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (x, y, sx, sy, r)])
+    valid = np.isfinite(x) & np.isfinite(y) & (sx>0) & (sy>0)
+    n = valid.sum(axis=-1)
+    x = np.where(valid, x, 0.)
+    y = np.where(valid, y, 0.)
+    r = np.where(valid, r, 0.)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wx = np.where(valid, 1./sx**2, 0.)
+        wy = np.where(valid, 1./sy**2, 0.)
+        alpha = np.sqrt(wx*wy)
+
+#       Start from the unweighted least squares slope
+        xm = x.sum(axis=-1)/n
+        ym = y.sum(axis=-1)/n
+        u0 = np.where(valid, x-xm[..., None], 0.)
+        v0 = np.where(valid, y-ym[..., None], 0.)
+        b = (u0*v0).sum(axis=-1)/(u0*u0).sum(axis=-1)
+
+        for iteration in range(max_iter):
+            bb = b[..., None]
+            w = np.where(valid, wx*wy/(wx+bb*bb*wy-2*bb*r*alpha), 0.)
+            sw = w.sum(axis=-1)
+            xbar = (w*x).sum(axis=-1)/sw
+            ybar = (w*y).sum(axis=-1)/sw
+            u = np.where(valid, x-xbar[..., None], 0.)
+            v = np.where(valid, y-ybar[..., None], 0.)
+            beta = np.where(valid, w*(u/wy+bb*v/wx-(bb*u+v)*r/alpha), 0.)
+            b_new = (w*beta*v).sum(axis=-1)/(w*beta*u).sum(axis=-1)
+            converged = ~(np.abs(b_new-b)>tol*np.abs(b_new))
+            b = b_new
+            if np.all(converged):
+                break
+
+        a = ybar-b*xbar
+#       Uncertainties from the least squares adjusted x values
+        x_adj = xbar[..., None]+beta
+        x_adj_bar = (w*x_adj).sum(axis=-1)/sw
+        uu = np.where(valid, x_adj-x_adj_bar[..., None], 0.)
+        slope_stdev = np.sqrt(1./(w*uu*uu).sum(axis=-1))
+        intercept_stdev = np.sqrt(1./sw+x_adj_bar**2*slope_stdev**2)
+        resid = np.where(valid, y-b[..., None]*x-a[..., None], 0.)
+        mswd = (w*resid*resid).sum(axis=-1)/(n-2)
+
+    ok = (n>=max(min_points, 3)) & np.isfinite(b)
+    fit = {'intercept': a, 'intercept_stdev': intercept_stdev,
+           'slope': b, 'slope_stdev': slope_stdev, 'mswd': mswd}
+    for name in fit:
+        fit[name] = np.where(ok, fit[name], np.nan)
+    fit['n'] = n
+    return fit
+
+
+def keeling_variables(conc, delta, conc_stdev, delta_stdev):
+    """ Keeling plot x, y, their uncertainties and error correlation
+    x = 1/c with sx = sc/c^2, y = delta with sy = sdelta (independent)
+    """
+    conc = np.asarray(conc, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1./conc, delta, np.abs(conc_stdev/conc**2), delta_stdev, 0.
+
+
+def miller_tans_variables(conc, delta, conc_stdev, delta_stdev):
+    """ Miller-Tans plot x, y, their uncertainties and error correlation
+    x = c, y = delta*c; both carry the error of c, so cov(x, y) = delta*sc^2
+    """
+    conc = np.asarray(conc, dtype=float)
+    delta = np.asarray(delta, dtype=float)
+    conc_stdev = np.asarray(conc_stdev, dtype=float)
+    sy = np.sqrt((conc*delta_stdev)**2+(delta*conc_stdev)**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = delta*conc_stdev/sy
+    return conc, delta*conc, conc_stdev, sy, np.where(np.isfinite(r), r, 0.)
+
+
+def fit_windows(conc, delta, conc_stdev, delta_stdev, window, step=1, first=0,
+                method='keeling', min_points=5):
+    """ York fits of every window of a regular grid
+    inputs:
+        conc, delta (np.array): gridded concentration and isotope ratio
+                                (e.g. ch4/d13ch4 or 12co2/d13co2), NaN where missing
+        conc_stdev, delta_stdev (np.array): gridded 1 sigma uncertainties
+        window, step, first (int): windows (grid slots, see window_matrix);
+                                   daily 13-17 on a 20-min grid: 12, 72, 39
+        method (str): 'keeling' or 'miller_tans'
+        min_points (int): minimum number of points per window
+
+    returns:
+        fit (dict): 'start' (first slot), york_fit outputs and 'source'
+                    (the source signature and its 'source_stdev')
+    """
+    if method=='keeling':
+        variables = keeling_variables(conc, delta, conc_stdev, delta_stdev)
+        source = 'intercept'
+    elif method=='miller_tans':
+        variables = miller_tans_variables(conc, delta, conc_stdev, delta_stdev)
+        source = 'slope'
+    else:
+        raise ValueError('Unknown method: %s' % method)
+
+    views = []
+    for values in variables:
+        values = np.broadcast_to(np.asarray(values, dtype=float), np.shape(conc))
+        starts, view = window_matrix(values, window, step, first)
+        views.append(view)
+    fit = york_fit(*views, min_points=min_points)
+    fit['start'] = starts
+    fit['source'] = fit[source]
+    fit['source_stdev'] = fit[source+'_stdev']
+    return fit
+
+
+def main():
+#   Daily 13:00-17:00 York fits of the regular 20-min CH4 grid
+    keeling_data = record_store.load_record('icl_ch4_keelingplot_data.h5')
+    for method in ('keeling', 'miller_tans'):
+        fit = fit_windows(keeling_data['ch4'], keeling_data['d13ch4'],
+                          keeling_data['ch4_stdev'], keeling_data['d13ch4_stdev'],
+                          window=12, step=72, first=39, method=method)
+        fit['time'] = keeling_data['time'][fit.pop('start')].astype('datetime64[D]')
+        record_store.save_record('icl_ch4_york_%s_daily.h5' % method, fit)
+
+if __name__=="__main__":
+    main()
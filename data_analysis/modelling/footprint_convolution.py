@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Modelled CH4 enhancements at ICL from NAME footprints and regional
+# (e.g. EDGAR, regridded with edgar_regrid) emissions, by sector.
+# - Footprints are read from netCDF files in chunks of time slices,
+#   never whole files, and each chunk is multiplied against all
+#   sectors at once: (n_times, n_cells) x (n_cells, n_sectors).
+# - Chunks are spread over a process pool.
+# - The modelled series are matched to the measurement times (e.g. the
+#   20-min times from processing_icl_measurements) with nearest_inds.
+# Footprints in (mol/mol)/(mol m-2 s-1), emissions in kg m-2 s-1,
+# enhancements in ppb.
+# *********************************************************************
+
+import sys
+import numpy as np
+import netCDF4
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append('//')
+import utils
+import record_store
+
+# Molar mass of CH4 (kg/mol)
+M_CH4 = 16.04e-3
+
+# Seconds per unit of CF time units
+TIME_UNITS = {'seconds': 1, 'minutes': 60, 'hours': 3600, 'days': 86400}
+
+
+def decode_times(values, units):
+    """ CF times ('<unit> since <date>') as datetime64[s]
+    """
+    unit, since = units.split(' since ')
+    origin = np.datetime64(since.strip().replace(' ', 'T')[:19], 's')
+    seconds = np.round(np.asarray(values, dtype=float)*TIME_UNITS[unit.strip().lower()])
+    return origin+seconds.astype(np.int64).astype('timedelta64[s]')
+
+
+def footprint_times(path, time_name='time'):
+    """ Times of the footprint slices in a netCDF file (only the time
+    variable is read)
+    """
+    with netCDF4.Dataset(path) as nc:
+        return decode_times(nc[time_name][:], nc[time_name].units)
+
+
+def read_footprints(path, start, stop, variable='fp', time_name='time'):
+    """ Footprint time slices start:stop of a netCDF file
+    inputs:
+        path (str): footprint file
+        start, stop (int): range of time slices
+        variable (str): footprint variable (dimensions time and lat, lon
+                        in any order)
+        time_name (str): time dimension
+
+    returns:
+        footprints (np.array): (stop-start, n_lat, n_lon)
+    """
+    with netCDF4.Dataset(path) as nc:
+        fp = nc[variable]
+        dims = list(fp.dimensions)
+        index = [slice(None)]*len(dims)
+        index[dims.index(time_name)] = slice(start, stop)
+        data = np.ma.filled(fp[tuple(index)], 0.)
+    spatial = [d for d in dims if d!=time_name]
+#   Put the grid in (lat, lon) order
+    order = [dims.index(time_name)]+[dims.index(d) for d in sorted(spatial, key=lambda d: 'lon' in d)]
+    return np.transpose(data, order)
+
+
+def _convolve_chunk(path, start, stop, emissions, variable, time_name):
+    """ Enhancements of all sectors for one chunk of footprint slices
+    (runs in a worker process)
+    """
+    footprints = read_footprints(path, start, stop, variable, time_name)
+    if footprints.shape[1]*footprints.shape[2]!=emissions.shape[1]:
+        raise ValueError('Footprints in %s are not on the emissions grid' % path)
+    return footprints.reshape(len(footprints), -1).dot(emissions.T)
+
+
+def _chunks(times, years, chunk_steps):
+    """ (start, stop) ranges of at most chunk_steps slices, split where
+    the emissions year changes
+    """
+    breaks = np.flatnonzero(np.diff(years))+1
+    edges = np.unique(np.concatenate([np.arange(0, len(times), chunk_steps), breaks, [len(times)]]))
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def convolve_footprints(paths, emissions, times=None, emission_years=None, variable='fp',
+                        time_name='time', chunk_steps=240, workers=1, tolerance=3600):
+    """ Modelled CH4 enhancement of each emissions sector
+    inputs:
+        paths (list): footprint netCDF files
+        emissions (dict): sector -> (n_lat, n_lon) emissions on the footprint
+                          grid, or (n_years, n_lat, n_lon) with emission_years
+        times (np.array): datetime64 measurement times to align to
+                          (None: footprint times)
+        emission_years (list): year of each emissions field; footprints use
+                               the closest year
+        variable (str): footprint variable
+        time_name (str): footprint time dimension
+        chunk_steps (int): footprint slices read and multiplied in one task
+        workers (int): worker processes (1: run in this process)
+        tolerance (float): max. time difference to a footprint (s)
+
+    returns:
+        modelled (dict): 'time' and, for each sector and for 'total', the
+                         enhancement (ppb), NaN where no footprint is
+                         within tolerance
+    """
+    sectors = list(emissions)
+    stacked = np.stack([np.asarray(emissions[sector], dtype=float) for sector in sectors])*1e9/M_CH4
+    if emission_years is None:
+        stacked = stacked[:, None]
+        emission_years = [0]
+    emission_years = np.asarray(emission_years)
+#   (n_years, n_sectors, n_cells)
+    stacked = np.swapaxes(stacked.reshape(stacked.shape[0], stacked.shape[1], -1), 0, 1)
+
+    fp_times = []
+    tasks = []
+    for path in paths:
+        file_times = footprint_times(path, time_name)
+        if len(emission_years)>1:
+            years = file_times.astype('datetime64[Y]').astype(int)+1970
+            year_index = np.argmin(np.abs(years[:, None]-emission_years[None, :]), axis=1)
+        else:
+            year_index = np.zeros(len(file_times), dtype=int)
+        for start, stop in _chunks(file_times, year_index, chunk_steps):
+            tasks.append((path, start, stop, stacked[year_index[start]], variable, time_name))
+        fp_times.append(file_times)
+
+    if workers==1:
+        parts = [_convolve_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_convolve_chunk, *zip(*tasks)))
+    fp_times = np.concatenate(fp_times) if fp_times else np.array([], dtype='datetime64[s]')
+    series = np.concatenate(parts) if parts else np.zeros((0, len(sectors)))
+
+    if times is None:
+        modelled = {'time': fp_times}
+        inds, mask = np.arange(len(fp_times)), np.ones(len(fp_times), dtype=bool)
+    else:
+        modelled = {'time': np.asarray(times)}
+        inds, mask = utils.nearest_inds(times, fp_times, tolerance)
+    for k, sector in enumerate(sectors+['total']):
+        values = series[:, k] if sector!='total' else series.sum(axis=1)
+        modelled[sector] = np.where(mask, values[inds], np.nan) if len(values) else np.full(len(mask), np.nan)
+    return modelled
+
+
+def main():
+#   Usage: python footprint_convolution.py EMISSIONS.npz FOOTPRINT.nc [FOOTPRINT.nc ...] [--workers N]
+#   EMISSIONS.npz: sector -> emissions on the footprint grid (kg m-2 s-1)
+    workers = int(sys.argv[sys.argv.index('--workers')+1]) if '--workers' in sys.argv else 1
+    args = [arg for i, arg in enumerate(sys.argv[1:], 1)
+            if not arg.startswith('--') and sys.argv[i-1]!='--workers']
+    with np.load(args[0]) as npz:
+        emissions = {sector: npz[sector] for sector in npz.files if sector not in ('lat', 'lon')}
+
+    measurements = record_store.load_record('icl_ch4_met.h5', variables=['time'])
+    modelled = convolve_footprints(args[1:], emissions, times=measurements['time'], workers=workers)
+    record_store.save_record('icl_ch4_modelled_sectors.h5', modelled)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Pollution roses: statistics of CH4 and d13CH4 per wind direction x
+# wind speed bin, optionally split by month or hour of day.
+# - Every sample gets one integer label (split, direction, speed)
+# - Counts and means come from bincount; medians and percentiles from
+#   one sort of each variable by (label, value), reading the order
+#   statistics of all bins at once
+# so roses of many subsets (mask) can be recomputed quickly.
+# *********************************************************************
+
+import sys
+import numpy as np
+
+sys.path.append('//')
+import record_store
+
+# Upper edge of the last speed bin is open (m/s)
+SPEED_EDGES = (0., 2., 4., 6., 8., np.inf)
+
+# Number of groups for each split
+SPLITS = {None: 1, 'month': 12, 'hour': 24}
+
+
+def direction_bins(wind_direction, n_directions=16):
+    """ Direction bin of each sample, bin 0 centred on north
+    inputs:
+        wind_direction (np.array): degrees, direction the wind comes from
+        n_directions (int): number of direction bins
+
+    returns:
+        bins (np.array): 0..n_directions-1, -1 where the direction is missing
+    """
+    width = 360./n_directions
+    direction = np.asarray(wind_direction, dtype=float)
+    valid = np.isfinite(direction)
+    bins = np.full(len(direction), -1, dtype=np.int64)
+    bins[valid] = ((direction[valid]+0.5*width) % 360.)//width
+    return bins
+
+
+def speed_bins(wind_speed, speed_edges=SPEED_EDGES):
+    """ Speed bin of each sample (bin i: edges[i] <= speed < edges[i+1])
+    returns:
+        bins (np.array): 0..len(speed_edges)-2, -1 where missing or outside
+    """
+    speed = np.asarray(wind_speed, dtype=float)
+    bins = np.searchsorted(np.asarray(speed_edges, dtype=float), speed, side='right')-1
+    outside = ~np.isfinite(speed) | (bins<0) | (bins>len(speed_edges)-2)
+    return np.where(outside, -1, bins)
+
+
+def split_groups(times, split=None):
+    """ Group of each sample for a split
+    inputs:
+        times (np.array): datetime64 sample times
+        split (str): None (one group), 'month' (0-11) or 'hour' (0-23)
+    """
+    if split not in SPLITS:
+        raise ValueError('Unknown split: %s' % split)
+    times = np.asarray(times)
+    if split=='month':
+        return times.astype('datetime64[M]').astype(np.int64) % 12
+    if split=='hour':
+        return times.astype('datetime64[h]').astype(np.int64) % 24
+    return np.zeros(len(times), dtype=np.int64)
+
+
+def binned_stats(values, labels, n_bins, percentiles=(25, 75)):
+    """ Count, mean, median and percentiles of values in each bin
+    Percentiles interpolate linearly between order statistics, as
+    np.percentile does.
+    inputs:
+        values (np.array): sample values (NaN ignored)
+        labels (np.array): bin of each sample, -1 to leave it out
+        n_bins (int): number of bins
+        percentiles (tuple): percentiles (0-100) besides the median
+
+    returns:
+        stats (dict): 'count', 'mean', 'median' and 'p<q>', each (n_bins,),
+                      NaN for empty bins
+    """
+    values = np.asarray(values, dtype=float)
+    keep = (labels>=0) & np.isfinite(values)
+    y, label = values[keep], labels[keep]
+    count = np.bincount(label, minlength=n_bins)
+    stats = {'count': count}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['mean'] = np.bincount(label, weights=y, minlength=n_bins)/count
+
+#   Sorted by bin, then value: bin b holds sorted_y[first[b]:first[b]+count[b]]
+        sorted_y = y[np.lexsort((y, label))]
+        first = np.cumsum(count)-count
+        empty = count==0
+        for name, q in [('median', 50)]+[('p%g' % q, q) for q in percentiles]:
+            position = first+q/100.*np.maximum(count-1, 0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower+1, first+np.maximum(count-1, 0))
+            if len(sorted_y):
+                lower_y = sorted_y[np.minimum(lower, len(sorted_y)-1)]
+                upper_y = sorted_y[np.minimum(upper, len(sorted_y)-1)]
+                result = lower_y+(position-lower)*(upper_y-lower_y)
+            else:
+                result = np.zeros(n_bins)
+            stats[name] = np.where(empty, np.nan, result)
+    return stats
+
+
+def pollution_rose(record, variables=('ch4', 'd13ch4'), n_directions=16,
+                   speed_edges=SPEED_EDGES, split=None, percentiles=(25, 75), mask=None):
+    """ Statistics per wind direction x speed bin (and split group)
+    inputs:
+        record (dict): 'time', 'wind_speed', 'wind_direction' and variables
+                       (e.g. from processing_icl_measurements)
+        variables (tuple): variables to summarise
+        n_directions (int): number of direction bins, bin 0 centred on north
+        speed_edges (tuple): speed bin edges (m/s)
+        split (str): None, 'month' or 'hour'
+        percentiles (tuple): percentiles (0-100) besides the median
+        mask (np.array): boolean, True for the samples to include (None: all)
+
+    returns:
+        rose (dict): 'direction' (bin centres, degrees), 'speed_edges',
+                     'group' (split groups) and, for each variable,
+                     name+'_count', '_mean', '_median' and '_p<q>', each
+                     (n_groups, n_directions, n_speeds)
+    """
+    group = split_groups(record['time'], split)
+    direction = direction_bins(record['wind_direction'], n_directions)
+    speed = speed_bins(record['wind_speed'], speed_edges)
+    n_groups = SPLITS[split]
+    n_speeds = len(speed_edges)-1
+
+    labels = (group*n_directions+direction)*n_speeds+speed
+    labels[(direction<0) | (speed<0)] = -1
+    if mask is not None:
+        labels[~np.asarray(mask, dtype=bool)] = -1
+
+    shape = (n_groups, n_directions, n_speeds)
+    rose = {'direction': np.arange(n_directions)*360./n_directions,
+            'speed_edges': np.asarray(speed_edges, dtype=float),
+            'group': np.arange(n_groups)}
+    for name in variables:
+        stats = binned_stats(record[name], labels, n_groups*n_directions*n_speeds, percentiles)
+        for key, values in stats.items():
+            rose[name+'_'+key] = values.reshape(shape)
+    return rose
+
+
+def main():
+#   Usage: python pollution_rose.py [--split month|hour]
+    split = sys.argv[sys.argv.index('--split')+1] if '--split' in sys.argv else None
+    ch4_dict = record_store.load_record('icl_ch4_met.h5')
+    rose = pollution_rose(ch4_dict, split=split)
+    np.savez('icl_ch4_pollution_rose%s.npz' % ('_'+split if split else ''), **rose)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------
+# Script to download .nc edgar v4.3.2 CH4 sector files (zipped)
+# Python version of wget_download_edgarv432.sh:
+# - sectors are downloaded concurrently (bounded thread pool)
+# - interrupted downloads resume from a .part file (HTTP Range)
+# - zips that already validate are skipped; corrupt ones are fetched again
+# - base_url can point at a local HTTP server for testing
+#
+# Usage: python download_edgarv432.py [DESTDIR] [--workers N] [--no-check-certificate]
+# -------------------------------------------------------------------
+# Author: Eric Saboya, Department of Physics, Imperial College London
+# Contact: ericsaboya54[at]gmail.com
+# -------------------------------------------------------------------
+
+import os
+import sys
+import ssl
+import time
+import zipfile
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Directory to download files to (spat-ocean)
+DESTDIR = "//home/ess17/Data/EmissionsInventories/EDGAR/v432/CH4/"
+
+BASE_URL = "https://cidportal.jrc.ec.europa.eu/ftp/jrc-opendata/EDGAR/datasets/v432/CH4"
+
+# EDGAR sector abbreviations and IPCC EDGAR sector codes
+SECTORS = [('AGS', '4C_4D1_4D2_4D4'),
+           ('AWB', '4F'),
+           ('CHE', '2B'),
+           ('ENE', '1A1a'),
+           ('ENF', '4A'),
+           ('FFF', '7A'),
+           ('IND', '1A2'),
+           ('IRO', '2C1a_2C1c_2C1d_2C1e_2C1f_2C2'),
+           ('MNM', '4B'),
+           ('PRO', '1B1a_1B2a1_1B2a2_1B2a3_1B2a4_1B2c'),
+           ('RCO', '1A4'),
+           ('REF_TRF', '1A1b_1A1c_1A5b1_1B1b_1B2a5_1B2a6_1B2b5_2C1b'),
+           ('SWD_INC', '6C'),
+           ('SWD_LDF', '6A_6D'),
+           ('TNR_Aviation_CDS', '1A3a_CDS'),
+           ('TNR_Aviation_CRS', '1A3a_CRS'),
+           ('TNR_Aviation_LTO', '1A3a_LTO'),
+           ('TNR_Other', '1A3c_1A3e'),
+           ('TNR_Ship', '1A3d_1C2'),
+           ('TRO', '1A3b'),
+           ('WWT', '6B')]
+
+CHUNK_BYTES = 1 << 20
+
+
+def zip_name(code, year=2012):
+    """ File name of an EDGAR v4.3.2 CH4 sector zip
+    """
+    return 'v432_CH4_%d_IPCC_%s.0.1x0.1.zip' % (year, code)
+
+
+def sector_url(sector, code, year=2012, base_url=BASE_URL):
+    """ URL of an EDGAR v4.3.2 CH4 sector zip
+    """
+    return '%s/%s/%s' % (base_url.rstrip('/'), sector, zip_name(code, year))
+
+
+def is_valid_zip(path):
+    """ True if path is a complete zip file whose members pass their CRC check
+    """
+    if not zipfile.is_zipfile(path):
+        return False
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return archive.testzip() is None
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+
+def download_file(url, dest_path, retries=3, timeout=60, context=None):
+    """ Download url to dest_path, resuming from dest_path+'.part'
+    inputs:
+        url (str): file URL
+        dest_path (str): output path
+        retries (int): attempts before giving up
+        timeout (float): socket timeout (s)
+        context (ssl.SSLContext): SSL context (None: default checks)
+
+    returns:
+        status (str): 'skipped' (valid zip already there) or 'downloaded'
+    """
+    if os.path.exists(dest_path) and is_valid_zip(dest_path):
+        return 'skipped'
+    part_path = dest_path+'.part'
+    for attempt in range(retries):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        expected = None
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header('Range', 'bytes=%d-' % offset)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout, context=context) as response:
+#               Server ignored the range: start again from the beginning
+                if not (offset and response.status==206):
+                    offset = 0
+                length = response.headers.get('Content-Length')
+                expected = offset+int(length) if length is not None else None
+                with open(part_path, 'ab' if offset else 'wb') as handle:
+                    while True:
+                        chunk = response.read(CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        handle.write(chunk)
+        except urllib.error.HTTPError as error:
+#           416: nothing left to fetch, the .part file is already complete
+            if not (error.code==416 and offset):
+                if attempt==retries-1:
+                    raise
+                time.sleep(2**attempt)
+                continue
+            if is_valid_zip(part_path):
+                os.replace(part_path, dest_path)
+                return 'downloaded'
+            os.remove(part_path)
+            continue
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            if attempt==retries-1:
+                raise
+            time.sleep(2**attempt)
+            continue
+
+#       Connection dropped early: keep the .part file and resume from it
+        if expected is not None and os.path.getsize(part_path)<expected:
+            if attempt<retries-1:
+                time.sleep(2**attempt)
+            continue
+
+        if is_valid_zip(part_path):
+            os.replace(part_path, dest_path)
+            return 'downloaded'
+#       Complete but corrupt: fetch the whole file again
+        os.remove(part_path)
+    raise IOError('Could not download a valid zip from %s' % url)
+
+
+def download_edgar(dest_dir=DESTDIR, sectors=SECTORS, year=2012, base_url=BASE_URL,
+                   max_workers=4, retries=3, check_certificate=True):
+    """ Download EDGAR v4.3.2 CH4 sector zips concurrently
+    A failed sector does not stop the others.
+    inputs:
+        dest_dir (str): directory to download files to
+        sectors (list): (sector abbreviation, IPCC code) pairs
+        year (int): emissions year
+        base_url (str): EDGAR CH4 dataset URL
+        max_workers (int): concurrent downloads
+        retries (int): attempts per file
+        check_certificate (bool): False mirrors wget --no-check-certificate
+
+    returns:
+        results (dict): sector -> 'skipped', 'downloaded' or 'failed: <error>'
+    """
+    if not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+    context = None
+    if not check_certificate:
+        context = ssl._create_unverified_context()
+
+    def fetch(sector, code):
+        dest_path = os.path.join(dest_dir, zip_name(code, year))
+        try:
+            return download_file(sector_url(sector, code, year, base_url), dest_path,
+                                 retries=retries, context=context)
+        except Exception as error:
+            return 'failed: %s' % error
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {sector: pool.submit(fetch, sector, code) for sector, code in sectors}
+        return {sector: future.result() for sector, future in futures.items()}
+
+
+def main():
+    workers = int(sys.argv[sys.argv.index('--workers')+1]) if '--workers' in sys.argv else 4
+    dest_dir = sys.argv[1] if len(sys.argv)>1 and not sys.argv[1].startswith('--') else DESTDIR
+
+    print("Downloading EDGAR v4.3.2 *2012* CH4 emissions ...")
+    results = download_edgar(dest_dir, max_workers=workers,
+                             check_certificate='--no-check-certificate' not in sys.argv)
+    for sector, status in results.items():
+        print('%-20s %s' % (sector, status))
+    sys.exit(1 if any(status.startswith('failed') for status in results.values()) else 0)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------
+# Lazy loader for EDGAR v4.3.2 0.1x0.1 CH4 sector files
+# - each sector zip is unpacked once into an uncompressed .npy cache
+#   (column_cache), rebuilt only if the zip changes
+# - grids are opened memory-mapped; only the cells inside a bounding
+#   box (e.g. the London domain) are ever read from disk
+# - the lat/lon index of the box is computed once for all sectors
+# -------------------------------------------------------------------
+# Author: Eric Saboya, Department of Physics, Imperial College London
+# Contact: ericsaboya54[at]gmail.com
+# -------------------------------------------------------------------
+
+import os
+import sys
+import zipfile
+import numpy as np
+import netCDF4
+
+sys.path.append('//')
+import column_cache
+
+import download_edgarv432
+
+# Emissions variable in the EDGAR v4.3.2 CH4 files (kg m-2 s-1)
+VARIABLE = 'emi_ch4'
+
+# Cache for unpacked sector grids
+CACHE_DIR = os.path.join(column_cache.DEFAULT_CACHE_DIR, 'edgar')
+
+# Example domain: Greater London (lat_min, lat_max, lon_min, lon_max)
+LONDON_BBOX = (51.2, 51.8, -0.6, 0.4)
+
+
+def sector_paths(data_dir, sectors=download_edgarv432.SECTORS, year=2012):
+    """ Paths of the downloaded sector zips
+    inputs:
+        data_dir (str): directory the zips were downloaded to
+        sectors (list): (sector abbreviation, IPCC code) pairs
+        year (int): emissions year
+
+    returns:
+        paths (dict): sector -> zip path
+    """
+    return {sector: os.path.join(data_dir, download_edgarv432.zip_name(code, year))
+            for sector, code in sectors}
+
+
+def read_sector_zip(zip_path, variable=VARIABLE):
+    """ Read the grid of a sector zip (netCDF file read from memory)
+    Latitudes are returned ascending; missing values become 0.
+    inputs:
+        zip_path (str): path to an EDGAR sector zip
+        variable (str): emissions variable
+
+    returns:
+        grid (dict): 'lat', 'lon' (cell centres) and 'emissions' (lat x lon)
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        names = [name for name in archive.namelist() if name.endswith('.nc')]
+        if not names:
+            raise ValueError('No netCDF file in %s' % zip_path)
+        raw = archive.read(names[0])
+    with netCDF4.Dataset('inmemory.nc', memory=raw) as nc:
+        lat = np.asarray(nc['lat'][:], dtype=float)
+        lon = np.asarray(nc['lon'][:], dtype=float)
+        emissions = np.ma.filled(nc[variable][:], 0.)
+    if lat[0]>lat[-1]:
+        lat, emissions = lat[::-1], emissions[::-1]
+    return {'lat': lat, 'lon': lon, 'emissions': np.ascontiguousarray(emissions)}
+
+
+def open_sector(zip_path, cache_dir=CACHE_DIR, variable=VARIABLE):
+    """ Memory-mapped grid of a sector, unpacking the zip on first use
+    returns:
+        grid (dict): see read_sector_zip (arrays memory-mapped)
+    """
+    tag = 'edgar_'+variable
+    grid = column_cache.load_columns(cache_dir, zip_path, tag)
+    if grid is None:
+        stamp = column_cache.source_stamp(zip_path)
+        column_cache.save_columns(cache_dir, zip_path, read_sector_zip(zip_path, variable),
+                                  tag, stamp=stamp)
+#       Reopen memory-mapped so the global grid is not kept in memory
+        grid = column_cache.load_columns(cache_dir, zip_path, tag)
+    return grid
+
+
+def bbox_index(lat, lon, bbox):
+    """ Index of the grid cells whose centres lie inside a bounding box
+    Works for 0-360 and -180-180 longitude grids, including boxes that
+    cross the grid's longitude seam (e.g. London on a 0-360 grid).
+    inputs:
+        lat (np.array): ascending cell centre latitudes
+        lon (np.array): ascending cell centre longitudes
+        bbox (tuple): (lat_min, lat_max, lon_min, lon_max), lon in degrees east
+
+    returns:
+        lat_index (slice): rows inside the box
+        lon_index (slice or np.array): columns inside the box
+    """
+    lat_min, lat_max, lon_min, lon_max = bbox
+    lat_index = slice(np.searchsorted(lat, lat_min, side='left'),
+                      np.searchsorted(lat, lat_max, side='right'))
+    if lon[-1]>180:
+        lon_min, lon_max = lon_min % 360, lon_max % 360
+    else:
+        lon_min, lon_max = (lon_min+180) % 360-180, (lon_max+180) % 360-180
+    first = np.searchsorted(lon, lon_min, side='left')
+    last = np.searchsorted(lon, lon_max, side='right')
+    if lon_min<=lon_max:
+        return lat_index, slice(first, last)
+#   Box crosses the seam: columns at the end of the grid, then at the start
+    return lat_index, np.concatenate([np.arange(first, len(lon)), np.arange(0, last)])
+
+
+def load_windows(zip_paths, bbox, cache_dir=CACHE_DIR, variable=VARIABLE):
+    """ Emissions of several sectors inside a bounding box
+    Only the box is read from the memory-mapped grids. If the box does
+    not cross the longitude seam the windows are views (no copy).
+    inputs:
+        zip_paths (dict): sector -> zip path (e.g. from sector_paths)
+        bbox (tuple): (lat_min, lat_max, lon_min, lon_max)
+        cache_dir (str): cache for the unpacked grids
+        variable (str): emissions variable
+
+    returns:
+        windows (dict): 'lat', 'lon' of the window cells and, for each
+                        sector, its (nlat, nlon) emissions window
+    """
+    windows = {}
+    index = None
+    for sector, zip_path in zip_paths.items():
+        grid = open_sector(zip_path, cache_dir, variable)
+        if index is None:
+            shape = grid['emissions'].shape
+            index = bbox_index(grid['lat'], grid['lon'], bbox)
+            windows['lat'] = np.asarray(grid['lat'][index[0]])
+            windows['lon'] = np.asarray(grid['lon'][index[1]])
+        elif grid['emissions'].shape!=shape:
+            raise ValueError('%s is not on the same grid as the other sectors' % zip_path)
+        windows[sector] = grid['emissions'][index[0]][:, index[1]]
+    return windows
+
+
+def main():
+    data_dir = sys.argv[1] if len(sys.argv)>1 else download_edgarv432.DESTDIR
+    windows = load_windows(sector_paths(data_dir), LONDON_BBOX)
+    for sector in download_edgarv432.SECTORS:
+        print('%-20s %s' % (sector[0], windows[sector[0]].shape))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------
+# Sector aggregation and re-gridding of EDGAR v4.3.2 CH4 emissions
+# - sectors are grouped into source categories (CATEGORIES)
+# - a sparse, area-weighted (conservative) regridding matrix from the
+#   EDGAR grid to a target (e.g. transport-model) grid is built once
+#   and cached as .npz (scipy.sparse.save_npz)
+# - all sectors and years are regridded in one sparse multiply
+# Emissions are fluxes per unit area (kg m-2 s-1), so each target
+# cell gets the area-weighted mean of the source cells it overlaps.
+# -------------------------------------------------------------------
+# Author: Eric Saboya, Department of Physics, Imperial College London
+# Contact: ericsaboya54[at]gmail.com
+# -------------------------------------------------------------------
+
+import os
+import sys
+import hashlib
+import numpy as np
+import scipy.sparse
+
+import edgar_loader
+
+# Source categories of the EDGAR sectors
+CATEGORIES = {'fossil_gas': ['PRO', 'REF_TRF'],   # fuel exploitation, transformation and gas distribution
+              'combustion': ['ENE', 'IND', 'RCO', 'TRO', 'TNR_Aviation_CDS', 'TNR_Aviation_CRS',
+                             'TNR_Aviation_LTO', 'TNR_Other', 'TNR_Ship', 'FFF'],
+              'industry': ['CHE', 'IRO'],
+              'waste': ['SWD_LDF', 'SWD_INC', 'WWT'],
+              'agriculture': ['AGS', 'AWB', 'ENF', 'MNM']}
+
+# Slack (degrees) allowed when checking that the source covers the target
+COVER_TOLERANCE = 1e-6
+
+# Cache for regridding matrices; bump CACHE_VERSION when the weights change
+CACHE_VERSION = 2
+CACHE_DIR = os.path.join(edgar_loader.CACHE_DIR, 'regrid')
+
+
+def group_sectors(emissions, categories=CATEGORIES):
+    """ Sum sector emissions into source categories
+    Sectors missing from emissions are skipped.
+    inputs:
+        emissions (dict): sector -> np.array (all the same shape)
+        categories (dict): category -> list of sectors
+
+    returns:
+        grouped (dict): category -> summed np.array (categories with no
+                        sector in emissions are left out)
+    """
+    grouped = {}
+    for category, sectors in categories.items():
+        present = [emissions[sector] for sector in sectors if sector in emissions]
+        if present:
+            grouped[category] = np.sum(present, axis=0)
+    return grouped
+
+
+def _unwrap_lon(lon):
+    """ Longitudes in [-180, 180), made monotonic across the 180 seam
+    """
+    lon = (np.asarray(lon, dtype=float)+180.) % 360.-180.
+    return np.rad2deg(np.unwrap(np.deg2rad(lon)))
+
+
+def cell_edges(centres):
+    """ Cell edges of a regular or irregular 1D grid from its cell centres
+    """
+    centres = np.asarray(centres, dtype=float)
+    mid = 0.5*(centres[1:]+centres[:-1])
+    return np.concatenate([[2*centres[0]-mid[0]], mid, [2*centres[-1]-mid[-1]]])
+
+
+def overlap_weights(source_edges, target_edges):
+    """ Fraction of each target cell covered by each source cell (1D)
+    inputs:
+        source_edges (np.array): ascending edges of the source cells
+        target_edges (np.array): ascending edges of the target cells
+
+    returns:
+        weights (scipy.sparse.csr_matrix): (n_target, n_source)
+    """
+    lower = np.maximum.outer(target_edges[:-1], source_edges[:-1])
+    upper = np.minimum.outer(target_edges[1:], source_edges[1:])
+    overlap = np.maximum(upper-lower, 0.)
+    return scipy.sparse.csr_matrix(overlap/np.diff(target_edges)[:, None])
+
+
+def build_regrid_matrix(source_lat, source_lon, target_lat, target_lon):
+    """ Sparse area-weighted regridding matrix between two lat/lon grids
+    Cell areas on the sphere scale with d(sin(lat)) x d(lon), so the
+    weights are the Kronecker product of a latitude and a longitude
+    overlap matrix. A global source grid is rolled so that its
+    longitude seam sits opposite the centre of the target grid; the
+    target grid must lie within the source grid.
+    inputs:
+        source_lat, source_lon (np.array): source cell centres (degrees)
+        target_lat, target_lon (np.array): target cell centres (degrees)
+
+    returns:
+        matrix (scipy.sparse.csr_matrix): (n_target_lat*n_target_lon,
+               n_source_lat*n_source_lon), for row-major (lat, lon) fields
+    """
+    source_lat = np.asarray(source_lat, dtype=float)
+    target_lat = np.asarray(target_lat, dtype=float)
+    if source_lat[0]>source_lat[-1] or target_lat[0]>target_lat[-1]:
+        raise ValueError('Latitudes must be ascending')
+    source_lon = _unwrap_lon(source_lon)
+    target_lon = _unwrap_lon(target_lon)
+    centre = 0.5*(target_lon[0]+target_lon[-1])
+    source_edges = cell_edges(source_lon)
+    if source_edges[-1]-source_edges[0]>=360.-COVER_TOLERANCE:
+#       Global grid: move the seam to centre+-180, reordering the columns
+        source_lon = (source_lon-centre+180.) % 360.+centre-180.
+        order = np.argsort(source_lon, kind='mergesort')
+    else:
+#       Regional grid: put it on the same 360 degree turn as the target
+        source_lon = source_lon+360.*np.round((centre-np.mean(source_lon))/360.)
+        order = np.arange(len(source_lon))
+    source_edges = cell_edges(source_lon[order])
+    target_edges = cell_edges(target_lon)
+
+    lat_edges = lambda lat: np.clip(cell_edges(lat), -90., 90.)
+    for name, source, target in [('latitude', lat_edges(source_lat), lat_edges(target_lat)),
+                                 ('longitude', source_edges, target_edges)]:
+        if target[0]<source[0]-COVER_TOLERANCE or target[-1]>source[-1]+COVER_TOLERANCE:
+            raise ValueError('Target %s %g to %g is not covered by the source grid (%g to %g)'
+                             % (name, target[0], target[-1], source[0], source[-1]))
+    sin_edges = lambda lat: np.sin(np.deg2rad(lat_edges(lat)))
+    lat_weights = overlap_weights(sin_edges(source_lat), sin_edges(target_lat))
+#   Columns back in the order of the source fields
+    lon_weights = overlap_weights(source_edges, target_edges)[:, np.argsort(order)]
+    return scipy.sparse.kron(lat_weights, lon_weights, format='csr')
+
+
+def regrid_matrix(source_lat, source_lon, target_lat, target_lon, cache_dir=CACHE_DIR):
+    """ Regridding matrix (build_regrid_matrix), built once and cached
+    The cache file is keyed on CACHE_VERSION and the four coordinate arrays.
+    inputs:
+        cache_dir (str): directory for the .npz matrices (None: no cache)
+
+    returns:
+        matrix (scipy.sparse.csr_matrix): see build_regrid_matrix
+    """
+    if cache_dir is None:
+        return build_regrid_matrix(source_lat, source_lon, target_lat, target_lon)
+    key = hashlib.sha1(b'%d|' % CACHE_VERSION)
+    for coords in (source_lat, source_lon, target_lat, target_lon):
+        key.update(np.ascontiguousarray(coords, dtype=float).tobytes())
+        key.update(b'|')
+    path = os.path.join(cache_dir, 'regrid_%s.npz' % key.hexdigest())
+    if os.path.exists(path):
+        return scipy.sparse.load_npz(path).tocsr()
+
+    matrix = build_regrid_matrix(source_lat, source_lon, target_lat, target_lon)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_path = path[:-len('.npz')]+'.tmp.npz'
+    scipy.sparse.save_npz(tmp_path, matrix)
+    os.replace(tmp_path, path)
+    return matrix
+
+
+def regrid_fields(matrix, fields, target_shape):
+    """ Apply a regridding matrix to a stack of fields
+    inputs:
+        matrix (scipy.sparse.csr_matrix): regridding matrix
+        fields (np.array): (..., n_source_lat, n_source_lon)
+        target_shape (tuple): (n_target_lat, n_target_lon)
+
+    returns:
+        regridded (np.array): (..., n_target_lat, n_target_lon)
+    """
+    fields = np.asarray(fields, dtype=float)
+    lead = fields.shape[:-2]
+    flat = fields.reshape(-1, fields.shape[-2]*fields.shape[-1])
+    return np.asarray(matrix.dot(flat.T)).T.reshape(lead+tuple(target_shape))
+
+
+def regrid_sectors(emissions, matrix, target_shape, categories=CATEGORIES):
+    """ Regrid all sectors (and years) in one sparse multiply
+    inputs:
+        emissions (dict): sector -> (n_years, n_lat, n_lon) or (n_lat, n_lon)
+                          emissions window (all the same shape)
+        matrix (scipy.sparse.csr_matrix): regridding matrix (regrid_matrix)
+        target_shape (tuple): (n_target_lat, n_target_lon)
+        categories (dict): category -> sectors (None: no grouping)
+
+    returns:
+        sectors (dict): sector -> regridded emissions
+        grouped (dict): category -> regridded emissions (group_sectors)
+    """
+    names = list(emissions)
+    regridded = regrid_fields(matrix, np.stack([emissions[name] for name in names]), target_shape)
+    sectors = dict(zip(names, regridded))
+    grouped = group_sectors(sectors, categories) if categories is not None else {}
+    return sectors, grouped
+
+
+def load_sector_years(data_dir, years, bbox, sectors=edgar_loader.download_edgarv432.SECTORS,
+                      cache_dir=edgar_loader.CACHE_DIR):
+    """ EDGAR windows of several years, stacked per sector
+    inputs:
+        data_dir (str): directory with the sector zips
+        years (list): emissions years
+        bbox (tuple): (lat_min, lat_max, lon_min, lon_max)
+        sectors (list): (sector abbreviation, IPCC code) pairs
+
+    returns:
+        emissions (dict): 'lat', 'lon' of the window and, for each sector,
+                          its (n_years, n_lat, n_lon) emissions
+    """
+    per_year = [edgar_loader.load_windows(edgar_loader.sector_paths(data_dir, sectors, year),
+                                          bbox, cache_dir)
+                for year in years]
+    emissions = {'lat': per_year[0]['lat'], 'lon': per_year[0]['lon']}
+    for sector, code in sectors:
+        emissions[sector] = np.stack([window[sector] for window in per_year])
+    return emissions
+
+
+def main():
+    data_dir = sys.argv[1] if len(sys.argv)>1 else edgar_loader.download_edgarv432.DESTDIR
+    emissions = load_sector_years(data_dir, [2012], edgar_loader.LONDON_BBOX)
+    lat, lon = emissions.pop('lat'), emissions.pop('lon')
+
+#   Example target grid: 0.2 x 0.2 degree cells over the London box
+    lat_min, lat_max, lon_min, lon_max = edgar_loader.LONDON_BBOX
+    target_lat = np.arange(lat_min+0.1, lat_max, 0.2)
+    target_lon = np.arange(lon_min+0.1, lon_max, 0.2)
+    matrix = regrid_matrix(lat, lon, target_lat, target_lon)
+    sectors, grouped = regrid_sectors(emissions, matrix, (len(target_lat), len(target_lon)))
+    for category, values in grouped.items():
+        print('%-12s mean flux %.3e kg m-2 s-1' % (category, values.mean()))
+
+if __name__=="__main__":
+    main()
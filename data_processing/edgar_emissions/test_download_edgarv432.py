@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------
+# Tests of download_edgarv432 against a local Range-capable HTTP server
+# (base_url points at the server, nothing is fetched from the internet)
+#
+# Usage: python -m pytest test_download_edgarv432.py
+# -------------------------------------------------------------------
+# Author: Eric Saboya, Department of Physics, Imperial College London
+# Contact: ericsaboya54[at]gmail.com
+# -------------------------------------------------------------------
+
+import io
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+import threading
+import unittest
+import http.server
+
+import download_edgarv432
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves files from the server's root, honouring 'Range: bytes=N-'
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('Range'))
+        path = os.path.join(self.server.root, self.path.lstrip('/'))
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as handle:
+            data = handle.read()
+        start = 0
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if match:
+            start = int(match.group(1))
+            if start>=len(data):
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data)-1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)-start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+class DownloadFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'server')
+        self.dest = os.path.join(self.tmp, 'dest')
+        os.makedirs(os.path.join(self.root, 'AGS'))
+        os.makedirs(self.dest)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('v432_CH4_2012_IPCC_4C_4D1_4D2_4D4.0.1x0.1.nc', os.urandom(4096))
+        self.payload = buffer.getvalue()
+        self.name = download_edgarv432.zip_name('4C_4D1_4D2_4D4')
+        with open(os.path.join(self.root, 'AGS', self.name), 'wb') as handle:
+            handle.write(self.payload)
+
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.root = self.root
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.url = download_edgarv432.sector_url('AGS', '4C_4D1_4D2_4D4', base_url=self.base_url)
+        self.dest_path = os.path.join(self.dest, self.name)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def write_part(self, nbytes):
+        with open(self.dest_path+'.part', 'wb') as handle:
+            handle.write(self.payload[:nbytes])
+
+    def test_complete_part_file_gets_416(self):
+        self.write_part(len(self.payload))
+        status = download_edgarv432.download_file(self.url, self.dest_path, retries=1)
+        self.assertEqual(status, 'downloaded')
+        self.assertEqual(self.server.requests, ['bytes=%d-' % len(self.payload)])
+        self.assertFalse(os.path.exists(self.dest_path+'.part'))
+        with open(self.dest_path, 'rb') as handle:
+            self.assertEqual(handle.read(), self.payload)
+
+    def test_partial_part_file_resumes(self):
+        self.write_part(len(self.payload)//2)
+        status = download_edgarv432.download_file(self.url, self.dest_path, retries=1)
+        self.assertEqual(status, 'downloaded')
+        self.assertEqual(self.server.requests, ['bytes=%d-' % (len(self.payload)//2)])
+        with open(self.dest_path, 'rb') as handle:
+            self.assertEqual(handle.read(), self.payload)
+
+    def test_download_edgar_uses_base_url(self):
+        results = download_edgarv432.download_edgar(self.dest, sectors=[('AGS', '4C_4D1_4D2_4D4')],
+                                                    base_url=self.base_url, retries=1)
+        self.assertEqual(results, {'AGS': 'downloaded'})
+        results = download_edgarv432.download_edgar(self.dest, sectors=[('AGS', '4C_4D1_4D2_4D4')],
+                                                    base_url=self.base_url, retries=1)
+        self.assertEqual(results, {'AGS': 'skipped'})
+
+
+if __name__=="__main__":
+    unittest.main()
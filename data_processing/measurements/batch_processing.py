@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Batch driver for processing_20min: runs a manifest of
+# (GCWerks file, met file, output store) jobs, e.g. several inlets or
+# years, on a process pool.
+# - Each job is processed incrementally (only rows appended since the
+#   last run), or in full if the job sets "full": true
+# - Every job is timed; a failing job is reported and the others carry on
+#
+# Manifest (JSON): a list of jobs,
+#   [{"gcwerks": "...", "met": "...", "output": "icl_ch4_met.h5"}, ...]
+# optional keys per job: "name", "full", "fmt", "block_rows"
+#
+# Usage: python batch_processing.py manifest.json [--workers N]
+# *********************************************************************
+
+import os
+import sys
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import processing_20min
+
+
+def load_manifest(manifest_path):
+    """ Read and check a job manifest
+    inputs:
+        manifest_path (str): path to the JSON manifest
+
+    returns:
+        jobs (list): job dicts, each with a 'name' (default: output path)
+    """
+    with open(manifest_path, 'r') as handle:
+        jobs = json.load(handle)
+    outputs = set()
+    for i, job in enumerate(jobs):
+        missing = [key for key in ('gcwerks', 'met', 'output') if key not in job]
+        if missing:
+            raise ValueError('Job %d of %s has no %s' % (i, manifest_path, ', '.join(missing)))
+        output = os.path.abspath(job['output'])
+        if output in outputs:
+            raise ValueError('Several jobs write to %s' % job['output'])
+        outputs.add(output)
+        job.setdefault('name', job['output'])
+    return jobs
+
+
+def run_job(job):
+    """ Process one job; errors are caught and returned, not raised
+    inputs:
+        job (dict): manifest entry
+
+    returns:
+        result (dict): 'name', 'status' ('ok' or 'failed'), 'n_new',
+                       'seconds' and 'error' (traceback, failed jobs only)
+    """
+    start = time.time()
+    result = {'name': job['name'], 'n_new': 0}
+    try:
+        state_path = job['output']+'.state'
+        if job.get('full') and os.path.exists(state_path):
+            os.remove(state_path)
+        result['n_new'] = processing_20min.processing_icl_measurements_incremental(
+            job['gcwerks'], job['met'], job['output'],
+            fmt=job.get('fmt'), block_rows=job.get('block_rows', 50000))
+        result['status'] = 'ok'
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.time()-start
+    return result
+
+
+def run_batch(jobs, workers=None):
+    """ Run jobs on a process pool
+    A job that fails, or whose worker process dies, is reported as failed
+    without stopping the other jobs.
+    inputs:
+        jobs (list): job dicts (see load_manifest)
+        workers (int): worker processes (default: one per CPU, at most one per job)
+
+    returns:
+        results (list): run_job results, in manifest order
+    """
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    results = [None]*len(jobs)
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception:
+                results[i] = {'name': jobs[i]['name'], 'status': 'failed', 'n_new': 0,
+                              'seconds': float('nan'), 'error': traceback.format_exc()}
+    return results
+
+
+def main():
+    manifest_path = sys.argv[1]
+    workers = int(sys.argv[sys.argv.index('--workers')+1]) if '--workers' in sys.argv else None
+    start = time.time()
+    results = run_batch(load_manifest(manifest_path), workers)
+    for result in results:
+        print('%-40s %-6s %8d new rows %8.1f s' % (result['name'], result['status'],
+                                                   result['n_new'], result['seconds']))
+        if result['status']!='ok':
+            print(result['error'])
+    n_failed = sum(result['status']!='ok' for result in results)
+    print('%d jobs, %d failed, %.1f s' % (len(results), n_failed, time.time()-start))
+    sys.exit(1 if n_failed else 0)
+
+if __name__=="__main__":
+    main()
@@ -13,127 +13,197 @@
 
 import os 
 import sys
-import pickle
+import json
 import numpy as np 
-import datetime as dt
 
 sys.path.append('//')
 import utils
+import gcwerks_reader
+import gcwerks_processing
+import timestamps
+import record_store
 
-def processing_icl_measurements(gcwerks_datapath, met_datapath):
-    """ Processing GCWerks and ClimeMet output
+CH4_COLUMNS=gcwerks_processing.species_columns(['ch4'], 'space')
+
+def ch4_from_gcwerks(gcwerks):
+    """ Dry-air correction and air-sample filtering of GCWerks columns
     inputs:
-        gcwerks_datapath (str): path to space-delimited GCWerks 20-min ave file
-        met_datapath (str): path to comma-delimited met data
+        gcwerks (dict): columns from gcwerks_reader (CH4_COLUMNS)
     
     returns:
         ch4_dict (dict): contains: 
+            - sample times (datetime64[m])
             - CH4, d13CH4 values and stdev 
-            - wind speed and direction
     """
-#     Processing GCWerks 20-min output
-    date, time, air_type=np.genfromtxt(gcwerks_datapath,
-                                       unpack=True,
-                                       usecols=(2,3,5),
-                                       delimiter='',
-                                       dtype=str,
-                                       skip_header=2)
-    d13ch4_c, d13ch4_c_stdev=np.genfromtxt(gcwerks_datapath,
-                                           unpack=True,
-                                           usecols=(11,14),
-                                           delimiter='',
-                                           skip_header=2)
-    _12ch4_c, _12ch4_c_stdev=np.genfromtxt(gcwerks_datapath,
-                                           unpack=True,
-                                           usecols=(21,24),
-                                           delimiter='',
-                                           skip_header=2)
-    h2o=np.genfromtxt(gcwerks_datapath,
-                      unpack=True,
-                      usecols=(10),
-                      delimiter='',
-                      skip_header=2)
-    
-#     Correct d13ch4 values using Zazzeri formula (15/9/2020)
-    d13ch4_dry=d13ch4_c/(-0.0109*h2o+1.0023)
-    d13ch4_stdev_dry=d13ch4_c_stdev/(-0.0109*h2o+1.0023)
-    
-#     Carbon-13 standard values (Brandt et al. 2010)
-    vpdb=0.0111802; vpdb_stdev=0.000016
-    
-#     Compute 13CH4 values
-    _13ch4_c=vpdb*_12ch4_c*(1+d13ch4_dry*1e-3)
-    _13ch4_c_stdev=vpdb_stdev*_12ch4_c_stdev*(1+d13ch4_stdev_dry*1e-3)
-    
-#     Retain indices that are 'air' samples 
-    inds_air=[]
-    for i in range(len(air_type)):
-        if 'air' in air_type[i]:
-            inds_air.append(i)
-            
-#     Filter data to retain measurements that sampled outdoor air
-    ch4, t, d13ch4, ch4_stdev, d13ch4_stdev = [],[],[],[],[]
-    for i in inds_air:
-        ch4.append(_12ch4_c[i]+_13ch4_c[i])
-        ch4_stdev.append(np.sqrt(_12ch4_c_stdev[i]**2 + _13ch4_c_stdev[i]**2))
-        d13ch4.append(d13ch4_dry[i])
-        d13ch4_stdev.append(d13ch4_stdev_dry[i])
-        t_load = date[i]+' '+time[i]
-        t.append(dt.datetime.strptime(t_load, "%y%m%d %H%M"))
-            
-#     Save data to dict.
-    ch4_dict={}
-    ch4_dict['time']=np.array(t)
-    ch4_dict['ch4']=np.array(ch4)*1.00028
-    ch4_dict['ch4_stdev']=np.array(ch4_stdev)*1.00028
-    ch4_dict['d13ch4']=np.array(d13ch4)*1.00028
-    ch4_dict['d13ch4_stdev']=np.array(d13ch4_stdev)*1.00028
-  
+    return gcwerks_processing.species_from_gcwerks(gcwerks, ['ch4'], 'space')['ch4']
 
-#     Processing met data
+def read_met(met_datapath):
+    """ Read ClimeMet 5-min met data
+    inputs:
+        met_datapath (str): path to comma-delimited met data
+    
+    returns:
+        met_dict (dict): met times (datetime64[s]), wind speed and direction
+    """
     t_met = np.genfromtxt(met_datapath, 
                           unpack=True, 
                           usecols=(0), 
                           delimiter=',', 
                           dtype=str, 
                           skip_header=1)
-    t_met_stamp = []
-    for i in range(len(t_met)):
-        t_met_stamp.append(dt.datetime.strptime(t_met[i], "%Y-%m-%d %H:%M:%S"))
+    t_met_stamp = timestamps.parse_timestamps(t_met, timestamps.CLIMEMET, unit='s')
     
     wind_direction, wind_speed=np.genfromtxt(met_datapath,
                                              unpack=True,
                                              usecols=(10,8),
                                              delimiter=',',
                                              skip_header=1)
+    
+    met_dict={}
+    met_dict['time']=t_met_stamp
+    met_dict['wind_speed']=wind_speed
+    met_dict['wind_direction']=wind_direction
+    return met_dict
+
+def add_met_data(ch4_dict, met_dict):
+    """ Attach the nearest (within 20 min) wind data to every CH4 sample
+    """
+#     Nearest met record (within 20 min) for every CH4 sample in one call
+    met_inds, met_mask=utils.nearest_inds(ch4_dict['time'], met_dict['time'], tolerance=1200)
+    ch4_dict['wind_speed']=np.where(met_mask, met_dict['wind_speed'][met_inds], np.nan)
+    ch4_dict['wind_direction']=np.where(met_mask, met_dict['wind_direction'][met_inds], np.nan)
+    return ch4_dict
+
+def processing_icl_measurements(gcwerks_datapath, met_datapath, cache_dir=None):
+    """ Processing GCWerks and ClimeMet output
+    inputs:
+        gcwerks_datapath (str): path to space-delimited GCWerks 20-min ave file
+        met_datapath (str): path to comma-delimited met data
+        cache_dir (str): directory for cached parsed columns (None: no cache)
+    
+    returns:
+        ch4_dict (dict): contains: 
+            - sample times (datetime64[m])
+            - CH4, d13CH4 values and stdev 
+            - wind speed and direction
+    """
+#     Processing GCWerks 20-min output (single pass over the file)
+    ch4_dict=gcwerks_processing.process_gcwerks(gcwerks_datapath, ['ch4'], 'space', cache_dir)['ch4']
 
-    wind_speed_20m, wind_direction_20m=[],[]
-    for i in range(len(t)):
-        ch4_date = t[i]
-        met_ind=utils.nearest_ind(t_met_stamp,ch4_date)
-        if len(met_ind)==0:
-            wind_speed_20m.append(np.nan)
-            wind_direction_20m.append(np.nan)
-        else:
-            wind_speed_20m.append(wind_speed[met_ind[0]])
-            wind_direction_20m.append(wind_direction[met_ind[0]])
-   
 #     Add met data to ch4_dict
-    ch4_dict['wind_speed']=np.array(wind_speed_20m)
-    ch4_dict['wind_direction']=np.array(wind_direction_20m)
+    return add_met_data(ch4_dict, read_met(met_datapath))
+
+def iter_processing_icl_measurements(gcwerks_datapath, met_dict, offset=0, block_rows=50000):
+    """ Streaming version of processing_icl_measurements
+    The GCWerks file is read in fixed-size blocks of rows; the dry-air
+    correction, air filtering and met join are applied per block, so
+    only one block of the record is held in memory at a time.
+    inputs:
+        gcwerks_datapath (str): path to space-delimited GCWerks 20-min ave file
+        met_dict (dict): met data from read_met
+        offset (int): byte offset to start from (0: start of file)
+        block_rows (int): GCWerks rows per block
     
-    return ch4_dict
+    yields:
+        ch4_dict (dict): processed air samples of one block
+        end_offset (int): byte offset just past the block
+    """
+    for gcwerks, end_offset in gcwerks_reader.iter_gcwerks_blocks(gcwerks_datapath, offset,
+                                                                  layout='space',
+                                                                  columns=CH4_COLUMNS,
+                                                                  block_rows=block_rows):
+        yield add_met_data(ch4_from_gcwerks(gcwerks), met_dict), end_offset
+
+def processing_icl_measurements_incremental(gcwerks_datapath, met_datapath, output_path,
+                                            fmt=None, block_rows=50000):
+    """ Process only the rows appended to the GCWerks file since the last run
+    The byte offset reached in the GCWerks file is kept in a state file
+    next to the output (output_path+'.state'). If the GCWerks file has been
+    replaced or truncated since, the full record is reprocessed. Rows are
+    streamed in blocks and appended to the store block by block.
+    inputs:
+        gcwerks_datapath (str): path to space-delimited GCWerks 20-min ave file
+        met_datapath (str): path to comma-delimited met data
+        output_path (str): record store holding the processed ch4_dict
+        fmt (str): record_store format, 'hdf5' or legacy 'pickle'
+                   (default: from the file extension)
+        block_rows (int): GCWerks rows per block
+    
+    returns:
+        n_new (int): number of air samples appended in this run
+    """
+    state_path=output_path+'.state'
+    source=os.path.abspath(gcwerks_datapath)
+    size=os.path.getsize(gcwerks_datapath)
+    
+#     Resume from the previous state if it still describes this file
+    state=None
+    if os.path.exists(state_path) and os.path.exists(output_path):
+        with open(state_path, 'r') as handle:
+            state=json.load(handle)
+        if (state['source']!=source or state['offset']>size or
+                state['head']!=_file_head(gcwerks_datapath, len(state['head'])//2)):
+            state=None
+    if state is None:
+        offset=0
+        last=None
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    else:
+        offset=state['offset']
+        last=record_store.last_time(output_path, fmt=fmt)
+    
+#     Parse and process only the new tail of the file, block by block
+    n_new=0
+    met_dict=None
+    for gcwerks, end_offset in gcwerks_reader.iter_gcwerks_blocks(gcwerks_datapath, offset,
+                                                                  layout='space',
+                                                                  columns=CH4_COLUMNS,
+                                                                  block_rows=block_rows):
+        new_dict=ch4_from_gcwerks(gcwerks)
+#     Guard against re-appending rows already in the record
+        if last is not None:
+            keep=new_dict['time']>last
+            new_dict={key: values[keep] for key, values in new_dict.items()}
+        if len(new_dict['time'])>0:
+#     Met join for the new rows only, then append to the store
+            if met_dict is None:
+                met_dict=read_met(met_datapath)
+            new_dict=add_met_data(new_dict, met_dict)
+            record_store.append_record(output_path, new_dict, fmt=fmt)
+            last=new_dict['time'][-1]
+            n_new+=len(new_dict['time'])
+        _write_state(state_path, source, end_offset, gcwerks_datapath)
+    
+    return n_new
+
+def _write_state(state_path, source, offset, gcwerks_datapath):
+    """ Record the byte offset reached in the GCWerks file
+    """
+    with open(state_path+'.tmp', 'w') as handle:
+        json.dump({'source': source,
+                   'offset': offset,
+                   'head': _file_head(gcwerks_datapath, min(offset, 4096))}, handle)
+    os.replace(state_path+'.tmp', state_path)
+
+def _file_head(datapath, nbytes):
+    """ First bytes of a file (as hex), used to detect a replaced file
+    """
+    with open(datapath, 'rb') as handle:
+        return handle.read(nbytes).hex()
     
             
 def main():
 #     Data paths
     picarro_data="//Volumes/HardDrive/PhD/disk1/data/Picarro/IMP_26magl/GCwerks/20min_record.txt"
     met_data="//Volumes/LaCie/CHAPTER1/Data/Observations/ICL_MET/RAW_COMPLETE.txt"
-#     Create dictionary
-    ch4_dict=processing_icl_measurements(picarro_data, met_data)
-#     Save dictionary
-    with open('icl_ch4_met.pickle','wb') as handle:
-        pickle.dump(ch4_dict, handle,protocol=pickle.HIGHEST_PROTOCOL)
+#     Create dictionary and save it. Only rows appended to the GCWerks
+#     file since the last run are processed, unless --full is given.
+#     --pickle writes the legacy pickle format instead of HDF5.
+    output_path='icl_ch4_met.pickle' if '--pickle' in sys.argv else 'icl_ch4_met.h5'
+    if '--full' in sys.argv and os.path.exists(output_path+'.state'):
+        os.remove(output_path+'.state')
+    processing_icl_measurements_incremental(picarro_data, met_data, output_path)
 
 if __name__=="__main__":
     main()
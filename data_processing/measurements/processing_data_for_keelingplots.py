@@ -10,94 +10,80 @@
 
 import os 
 import sys
-import pickle
 import numpy as np
-import datetime as dt
 
-def keeling_plot_data_processing(ch4_data):
+sys.path.append('//')
+import gridding
+import windows
+import record_store
+import compact_record
+
+# Afternoon (13:00-17:00) views of the gridded variables
+DAY_VIEWS = {'ch4_day': 'ch4',
+             'ch4_day_stdev': 'ch4_stdev',
+             'd13ch4_day': 'd13ch4',
+             'd13ch4_day_stdev': 'd13ch4_stdev'}
+
+def afternoon_views(keelingplot_dict):
+  """ Masked 13:00-17:00 views (DAY_VIEWS) of a Keeling plot record
+  The views share the record's data and its 'afternoon' mask.
+  """
+  return compact_record.masked_views(keelingplot_dict, keelingplot_dict['afternoon'], DAY_VIEWS)
+
+def keeling_plot_data_processing(ch4_data, start='2018-01-01', end=None, float32=False):
   """
   Function for putting data into a regular array for Keeling Plots
+  inputs:
+      ch4_data (str): path to processed ICL CH4 record (HDF5 or pickle)
+      start (datetime64/datetime/str): start of the 20-min grid (midnight)
+      end (datetime64/datetime/str): end of the 20-min grid
+                                     (default: midnight after the last sample)
+      float32 (bool): keep the gridded values as float32
+
+  returns:
+      ch4_keelingplot_dict (dict): 'time' (datetime64[m]), gridded CH4 and
+          d13CH4 (and stdev), 'afternoon' (True for 13:00-17:00 slots), and
+          masked afternoon views of them ('ch4_day' etc., see DAY_VIEWS)
   """
-#   Load ICL dictionary with CH4 data
-  with open(ch4_data, 'rb') as handle:
-    ch4_dict = pickle.load(handle)
-  
-  time_icl=ch4_dict['time']
-  ch4_icl=ch4_dict['ch4']
-  ch4_stdev_icl=ch4_dict['ch4_stdev']
-  d13ch4_icl=ch4_dict['d13ch4']
-  d13ch4_stdev_icl=ch4_dict['d13ch4_stdev']  
+#   Load ICL dictionary with CH4 data (HDF5 record store or legacy pickle)
+  ch4_dict = record_store.load_record(ch4_data)
   
-#   Regular arrays for all ICL data
-  time_array=[]
-  ch4_array=np.zeros(78912)+np.nan
-  ch4_stdev_array=np.zeros(78912)+np.nan
-  d13ch4_array=np.zeros(78912)+np.nan
-  d13ch4_stdev_array=np.zeros(78912)+np.nan
-  
-  for i in range(0, len(time_icl)-1):
-    delta_day=(time_icl[i]- dt.datetime(2018,1,1,0,0)).days*72
-    hour=3*time_icl[i].hour
-    minute=time_icl[i].minute
-    
-    if minute<20:
-      loc=delta_day+hour
-      ch4_array[loc]=ch4_icl[i]
-      ch4_stdev_array[loc]=ch4_stdev_icl[i]
-      d13ch4_array[loc]=d13ch4_icl[i]
-      d13ch4_stdev_array[loc]=d13ch4_stdev_icl[i]
-      
-    elif minute<40 and minute>=20:
-      loc=delta_day+hour+1
-      ch4_array[loc]=ch4_icl[i]
-      ch4_stdev_array[loc]=ch4_stdev_icl[i]
-      d13ch4_array[loc]=d13ch4_icl[i]
-      d13ch4_stdev_array[loc]=d13ch4_stdev_icl[i]
-      
-    elif minute<60 and minute>=40:
-      loc=delta_day+hour+2
-      ch4_array[loc]=ch4_icl[i]
-      ch4_stdev_array[loc]=ch4_stdev_icl[i]
-      d13ch4_array[loc]=d13ch4_icl[i]
-      d13ch4_stdev_array[loc]=d13ch4_stdev_icl[i]
-                                 
-    time_array.append(time_icl[i])
+#   Regular 20-min arrays for all ICL data, whole days from start to end
+  start=np.datetime64(start, 'D')
+  if end is not None:
+    end=np.datetime64(end, 'D')
+  ordered_times, gridded = gridding.grid_record(ch4_dict['time'],
+                                                {'ch4': ch4_dict['ch4'],
+                                                 'ch4_stdev': ch4_dict['ch4_stdev'],
+                                                 'd13ch4': ch4_dict['d13ch4'],
+                                                 'd13ch4_stdev': ch4_dict['d13ch4_stdev']},
+                                                start=start, end=end, step_minutes=20)
+  gridded['time']=ordered_times
+  ch4_keelingplot_dict=compact_record.compact(gridded, float32=float32)
     
-#     Filter data to retain values from 13:00-17:00
-  ch4_day_array=np.zeros(78912)+np.nan
-  ch4_day_stdev_array=np.zeros(78912)+np.nan
-  d13ch4_day_array=np.zeros(78912)+np.nan
-  d13ch4_day_stdev_array=np.zeros(78912)+np.nan
-  
-  for i in range(0, len(ch4_array), 72):
-    for j in range(i+39, i+51):
-      ch4_day_array[j]=ch4_array[j]
-      ch4_day_stdev_array[j]=ch4_stdev_array[j]
-      d13ch4_day_array[j]=d13ch4_array[j]
-      d13ch4_day_stdev_array[j]=d13ch4_stdev_array[j]
-  
-  ordered_times = np.arange(dt.datetime(2018,1,1,0,0), dt.datetime(2021,1,1,0,0), dt.timedelta(minutes=20)).astype(dt.datetime)
-  
-  ch4_keelingplot_dict={}
-  ch4_keelingplot_dict['time']=ordered_times
-  ch4_keelingplot_dict['ch4']=ch4_array
-  ch4_keelingplot_dict['ch4_stdev']=ch4_stdev_array
-  ch4_keelingplot_dict['d13ch4']=d13ch4_array
-  ch4_keelingplot_dict['d13ch4_stdev']=d13ch4_stdev_array
-  ch4_keelingplot_dict['ch4_day']=ch4_day_array
-  ch4_keelingplot_dict['ch4_day_stdev']=ch4_day_stdev_array
-  ch4_keelingplot_dict['d13ch4_day']=d13ch4_day_array
-  ch4_keelingplot_dict['d13ch4_day_stdev']=d13ch4_day_stdev_array
+#     Retain values from 13:00-17:00 as masked views (no copies of the data)
+  ch4_keelingplot_dict['afternoon']=windows.grid_window_mask(len(ordered_times), 13, 17, step_minutes=20)
+  ch4_keelingplot_dict.update(afternoon_views(ch4_keelingplot_dict))
   
   return ch4_keelingplot_dict
 
 
 def main():
-  ch4_data_path="icl_ch4_met.pickle"
-  ch4_keelingplot_dict=keeling_plot_data_processing(ch4_data_path)
+#   --pickle reads/writes the legacy pickle format instead of HDF5
+#   --float32 stores the gridded values as float32
+  ext = '.pickle' if '--pickle' in sys.argv else '.h5'
+  ch4_data_path="icl_ch4_met"+ext
+  ch4_keelingplot_dict=keeling_plot_data_processing(ch4_data_path, float32='--float32' in sys.argv)
+  print(compact_record.format_footprint(compact_record.memory_footprint(ch4_keelingplot_dict)))
   
-  with open('icl_ch4_keelingplot_data.pickle', 'wb') as handle:
-    pickle.dump(ch4_keelingplot_dict, handle, protocol=pickle.HIGHEST_PROTOCOL)
+#   HDF5: the afternoon views are rebuilt from 'afternoon' (afternoon_views) after loading
+#   pickle: legacy layout, with NaN-filled '_day' arrays
+  if ext=='.pickle':
+    record={key: (np.ma.filled(values, np.nan) if key in DAY_VIEWS else values)
+            for key, values in ch4_keelingplot_dict.items()}
+  else:
+    record={key: values for key, values in ch4_keelingplot_dict.items() if key not in DAY_VIEWS}
+  record_store.save_record('icl_ch4_keelingplot_data'+ext, record)
 
 if __name__=="__main__":
   main()
@@ -4,109 +4,214 @@
 # Contact: ericsaboya54@gmail.com
 # *********************************************************************
 # About:
-# Script to look at the daily changes in CH4 and d13CH4 data between 
-# the tank intervals. 
+# Script to look at the daily changes in CH4 and d13CH4 data between
+# the tank intervals.
+# - Consecutive injections of a standard tank (no gap longer than
+#   max_gap_minutes) form one tank interval
+# - Per interval: mean CH4/d13CH4, their stdev and the drift (linear
+#   trend within the interval, and change since the tank's previous
+#   interval)
+# - Between consecutive calibration sessions (tank intervals of all
+#   tanks merged where they overlap or nearly touch): ambient air mean
+#   CH4/d13CH4 and their daily change (linear trend within the gap)
+# All statistics are computed with reduceat over sorted
+# arrays, without loops over rows.
 # *********************************************************************
 
 import os
 import sys
 import numpy as np
-import datetime as dt
 
-def icl_tank_intervals(gcwerks_datapath, p_datapath):
+sys.path.append('//')
+import gcwerks_reader
+import gcwerks_processing
+import record_store
+
+#     Standards from 15/1/2018 - 17/4/2019 (D334212, D334213)
+#     and from 17/4/2019 onwards (D671527, D671528)
+TANKS = ('D334212', 'D334213', 'D671527', 'D671528')
+
+def _minutes(times):
+  return np.asarray(times, dtype='datetime64[m]').astype(np.int64).astype(float)
+
+def group_injections(times, max_gap_minutes=60):
+  """ Split sorted injection times of one tank into intervals
+  inputs:
+      times (np.array): sorted datetime64 injection times
+      max_gap_minutes (float): a longer gap starts a new interval
+
+  returns:
+      offsets (np.array): interval i is times[offsets[i]:offsets[i+1]]
+  """
+  breaks =np.flatnonzero(np.diff(_minutes(times))>max_gap_minutes)+1
+  return np.concatenate([[0], breaks, [len(times)]]).astype(np.int64)
+
+def interval_stats(times, values, offsets):
+  """ Mean, stdev and within-interval drift of values for each interval
+  inputs:
+      times (np.array): sorted datetime64 times
+      values (dict): name -> values at times
+      offsets (np.array): interval offsets (group_injections)
+
+  returns:
+      stats (dict): 'start', 'end', 'n', and for each name: name (mean),
+                    name+'_stdev' and name+'_drift' (slope, per hour)
+  """
+  starts, ends =offsets[:-1], offsets[1:]
+  n =(ends-starts).astype(float)
+  t =_minutes(times)/60.
+#   Hours since each interval's first injection
+  t =t-np.repeat(t[starts], ends-starts)
+  sum_t =np.add.reduceat(t, starts)
+  sum_tt =np.add.reduceat(t*t, starts)
+  stats ={'start': np.asarray(times)[starts], 'end': np.asarray(times)[ends-1], 'n': n}
+  with np.errstate(divide='ignore', invalid='ignore'):
+    stt =sum_tt-sum_t**2/n
+    for name, y in values.items():
+      y =np.asarray(y, dtype=float)
+      sum_y =np.add.reduceat(y, starts)
+      mean =sum_y/n
+      resid =y-np.repeat(mean, ends-starts)
+      stats[name] =mean
+      stats[name+'_stdev'] =np.sqrt(np.add.reduceat(resid**2, starts)/(n-1))
+      stats[name+'_drift'] =np.where(stt>0, (np.add.reduceat(t*y, starts)-sum_t*mean)/stt, np.nan)
+  return stats
+
+def tank_intervals(tank_data, max_gap_minutes=60):
+  """ Tank intervals of all standards, sorted by start time
+  inputs:
+      tank_data (dict): tank name -> dict with 'time', 'ch4', 'd13ch4'
+      max_gap_minutes (float): see group_injections
+
+  returns:
+      intervals (dict): 'time' (interval start), 'end', 'tank' (index in
+                        TANKS), 'n', 'ch4', 'd13ch4', their '_stdev' and
+                        '_drift' (per hour), and '_change_per_day' (change
+                        of the mean since the tank's previous interval)
+  """
+  parts =[]
+  for tank, data in tank_data.items():
+    order =np.argsort(data['time'], kind='mergesort')
+    times =np.asarray(data['time'], dtype='datetime64[m]')[order]
+    if len(times)==0:
+      continue
+    offsets =group_injections(times, max_gap_minutes)
+    stats =interval_stats(times, {'ch4': data['ch4'][order], 'd13ch4': data['d13ch4'][order]}, offsets)
+    days =np.diff(_minutes(stats['start']))/1440.
+    for name in ('ch4', 'd13ch4'):
+      stats[name+'_change_per_day'] =np.concatenate([[np.nan], np.diff(stats[name])/days])
+    stats['tank'] =np.full(len(stats['n']), TANKS.index(tank))
+    parts.append(stats)
+
+  if not parts:
+    return {}
+  order =np.argsort(np.concatenate([part['start'] for part in parts]), kind='mergesort')
+  intervals ={key: np.concatenate([part[key] for part in parts])[order] for key in parts[0]}
+  intervals['time'] =intervals.pop('start')
+  return intervals
+
+def calibration_sessions(intervals, max_gap_minutes=60):
+  """ Merge tank intervals of any tank that overlap or are less than
+  max_gap_minutes apart (e.g. standards run back to back) into sessions
+  inputs:
+      intervals (dict): tank intervals (tank_intervals), sorted by 'time'
+      max_gap_minutes (float): a longer gap starts a new session
+
+  returns:
+      sessions (dict): 'time' (session start), 'end' (session end)
+  """
+  start =np.asarray(intervals['time'], dtype='datetime64[m]')
+  end =np.asarray(intervals['end'], dtype='datetime64[m]')
+#   Latest end of all earlier intervals: an interval starting within
+#   max_gap_minutes of it belongs to the same session
+  latest_end =np.maximum.accumulate(_minutes(end))
+  new =np.concatenate([[True], _minutes(start[1:])-latest_end[:-1]>max_gap_minutes])
+  first =np.flatnonzero(new)
+  last =np.append(first[1:], len(start))-1
+  return {'time': start[first], 'end': latest_end[last].astype(np.int64).astype('datetime64[m]')}
+
+def ambient_changes(air_data, intervals, max_gap_minutes=60):
+  """ Ambient air statistics between consecutive calibration sessions
+  Tank intervals are first merged into sessions (calibration_sessions),
+  so standards run back to back do not create gaps of their own. The
+  daily change of a gap is the slope of a linear fit of its air samples
+  against time (interval_stats), so gaps within one day also get one.
+  inputs:
+      air_data (dict): 'time', 'ch4', 'd13ch4' of air samples
+      intervals (dict): tank intervals (tank_intervals)
+      max_gap_minutes (float): see calibration_sessions
+
+  returns:
+      ambient (dict): 'time' (gap start), 'end', 'n', 'ch4', 'd13ch4'
+                      (gap means), their '_stdev' and '_daily_change'
+                      (slope, per day; NaN with fewer than 2 samples)
+  """
+  order =np.argsort(air_data['time'], kind='mergesort')
+  times =np.asarray(air_data['time'], dtype='datetime64[m]')[order]
+  sessions =calibration_sessions(intervals, max_gap_minutes)
+  gap_start =sessions['end'][:-1]
+  gap_end =sessions['time'][1:]
+  first =np.searchsorted(times, gap_start, side='right')
+  last =np.maximum(np.searchsorted(times, gap_end, side='left'), first)
+  n =last-first
+
+  ambient ={'time': gap_start, 'end': gap_end, 'n': n}
+  for name in ('ch4', 'd13ch4'):
+    for key in (name, name+'_stdev', name+'_daily_change'):
+      ambient[key] =np.full(len(n), np.nan)
+  filled =np.flatnonzero(n>0)
+  if len(filled)==0:
+    return ambient
+
+#   Air samples of the gaps with data, one after the other
+  counts =n[filled]
+  rows =np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts, counts)+np.repeat(first[filled], counts)
+  offsets =np.concatenate([[0], np.cumsum(counts)])
+  stats =interval_stats(times[rows],
+                        {name: np.asarray(air_data[name], dtype=float)[order][rows]
+                         for name in ('ch4', 'd13ch4')},
+                        offsets)
+  for name in ('ch4', 'd13ch4'):
+    ambient[name][filled] =stats[name]
+    ambient[name+'_stdev'][filled] =stats[name+'_stdev']
+    ambient[name+'_daily_change'][filled] =stats[name+'_drift']*24.
+  return ambient
+
+def icl_tank_intervals(gcwerks_datapath, p_datapath=None, cache_dir=None, max_gap_minutes=60):
   """ Find average CH4 in tank interval periods
   inputs:
       gcwerks_datapath (str): path to gcwerks space delimited datafile
-      p_datapath (str): path to ICL pressure measurements
-  
+      p_datapath (str): path to ICL pressure measurements. Not used yet:
+                        the pressure file format still has to be settled
+      cache_dir (str): directory for cached parsed columns (None: no cache)
+      max_gap_minutes (float): longest gap between injections of one interval
+
+  returns:
+      intervals (dict): per tank interval statistics (tank_intervals)
+      ambient (dict): ambient air statistics between intervals (ambient_changes)
   """
-#     Processing GCWerks 20-min output
-  date, time, air_type =np.genfromtxt(gcwerks_datapath,
-                                      unpack=True,
-                                      usecols=(2,3,5),
-                                      delimiter='',
-                                      dtype=str,
-                                      skip_header=2)
-  d13ch4_c, d13ch4_c_stdev =np.genfromtxt(gcwerks_datapath,
-                                          unpack=True,
-                                          usecols=(11,14),
-                                          delimiter='',
-                                          skip_header=2) 
-  _12ch4_c, _12ch4_c_stdev =np.genfromtxt(gcwerks_datapath,
-                                          unpack=True,
-                                          usecols=(21,24),
-                                          delimiter='',
-                                          skip_header=2)
-  h2o =np.genfromtxt(gcwerks_datapath,
-                     unpack=True,
-                     usecols=(10),
-                     delimiter='',
-                     skip_header=2)
-    
-#     Correct d13ch4 values using Zazzeri formula (15/9/2020)
-  d13ch4_dry =d13ch4_c/(-0.0109*h2o+1.0023)
-  d13ch4_stdev_dry =d13ch4_c_stdev/(-0.0109*h2o+1.0023)
-    
-#     Carbon-13 standard values (Brandt et al. 2010)
-  vpdb=0.0111802; vpdb_stdev=0.000016
-    
-#     Compute 13CH4 values
-  _13ch4_c =vpdb*_12ch4_c*(1+d13ch4_dry*1e-3)
-  _13ch4_c_stdev =vpdb_stdev*_12ch4_c_stdev*(1+d13ch4_stdev_dry*1e-3)
-    
-#     Find indices for different measurement tanks
-  air_inds =[]
-#     Standards from 15/1/2018 - 17/4/2019  
-  D334212 =[]
-  D334213 =[]
-#     Standards from 17/4/2019 onwards
-  D671527 =[]
-  D671528 =[]
-
-  for i in range(len(air_type)):
-    if 'air' in air_type[i]:
-      air_inds.append(i)
-      
-    elif 'D671527' in air_type[i]:
-      D671527.append(i)
-      
-    elif 'D671528' in air_type[i]:
-      D671528.append(i)
-      
-    elif 'D334212' in air_type[i]:
-      D334212.append(i)
-      
-    elif 'D334213' in air_type[i]:
-      D334213.append(i)
-  
-#   Samples of atmospheric CH4
-  time_sample =[]
-  ch4_c, ch4_stdev, d13ch4_c, d13ch4_stdev =[], [], [], []
-  for i in air_inds:
-    ch4_c.append(_12ch4_c[i] +_13ch4_c[i])
-    ch4_stdev.append(np.sqrt(_12ch4_c_stdev[i]**2 +_13ch4_c_stdev[i]**2))
-    d13ch4_c.append(d13ch4_dry[i])
-    d13ch4_stdev.append(d13ch4_stdev_dry[i])
-    t_hold =date[i]+' '+time[i]
-    time_sample.append(dt.datetime.strptime(t_hold, "%y%m%d %H%M"))
-
-#   Standards
-  time_D671527, time_D671528 = [], []
-  for i in D671527:
-    t_hold =date[i]+' '+time[i]
-    time_D671527.append(dt.datetime.strptime(t_hold, "%y%m%d %H%M"))   
-  for i in D671528:
-    t_hold =date[i]+' '+time[i]
-    time_D671528.append(dt.datetime.strptime(t_hold, "%y%m%d %H%M"))
-    
-# 20-minute spaced arrays
-  ch4_array =np.zeros(78912)+np.nan
-  d13ch4_array =np.zeros(78912)+np.nan
-  ch4_stdev_array =np.zeros(78912)+np.nan
-  d13ch4_stdev_array =np.zeros(78912)+np.nan
-  time_D671527_array =np.zeros(78912)+np.nan
-  time_D671528_array =np.zeros(78912)+np.nan
-
-
-Pressure_array   = np.zeros(78912)+np.nan
-    
+#     Processing GCWerks 20-min output (single pass over the file)
+  gcwerks =gcwerks_reader.read_gcwerks(gcwerks_datapath,
+                                       layout='space',
+                                       columns=gcwerks_processing.species_columns(['ch4'], 'space'),
+                                       cache_dir=cache_dir)
+
+#     Samples of atmospheric CH4 and of each standard tank
+#     (dry-air correction as for the air samples)
+  air_data =gcwerks_processing.species_from_gcwerks(gcwerks, ['ch4'], 'space')['ch4']
+  tank_data ={tank: gcwerks_processing.species_from_gcwerks(gcwerks, ['ch4'], 'space', sample=tank)['ch4']
+              for tank in TANKS}
+
+  intervals =tank_intervals(tank_data, max_gap_minutes)
+  if not intervals:
+    return intervals, {}
+  return intervals, ambient_changes(air_data, intervals, max_gap_minutes)
+
+def main():
+  picarro_data="//Volumes/HardDrive/PhD/disk1/data/Picarro/IMP_26magl/GCwerks/20min_record.txt"
+  intervals, ambient =icl_tank_intervals(picarro_data)
+  record_store.save_record('icl_tank_intervals.h5', intervals)
+  record_store.save_record('icl_tank_interval_ambient_changes.h5', ambient)
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Fit long-term trends against time (decimal years since a start
+# date) for several species at once.
+# - 'linear':    a + b*t
+# - 'quadratic': a + b*t + c*t^2
+# - 'harmonic':  quadratic trend plus n annual harmonics (as CCGCRV,
+#                Thoning et al., 1989); the trend is the polynomial part
+# Every species (each with its own missing values) is solved in one
+# batched least squares solve. Results can be cached with column_cache.
+# *********************************************************************
+
+import hashlib
+import numpy as np
+
+import column_cache
+
+MODELS = ('linear', 'quadratic', 'harmonic')
+
+DAYS_PER_YEAR = 365.25
+
+
+def decimal_years(times, t0):
+    """ Time since t0 in years (of 365.25 days)
+    """
+    minutes = (np.asarray(times, dtype='datetime64[m]')-np.datetime64(t0, 'm')).astype(np.int64)
+    return minutes/(1440.*DAYS_PER_YEAR)
+
+
+def design_matrix(t, model='linear', n_harmonics=4):
+    """ Least squares design matrix
+    inputs:
+        t (np.array): decimal years since the start date
+        model (str): 'linear', 'quadratic' or 'harmonic'
+        n_harmonics (int): annual harmonics of the 'harmonic' model
+
+    returns:
+        A (np.array): (len(t), ncoefs); the first n_trend columns are the
+                      polynomial trend
+        n_trend (int): number of trend columns
+    """
+    if model not in MODELS:
+        raise ValueError('Unknown trend model: %s' % model)
+    n_trend = 2 if model=='linear' else 3
+    columns = [t**p for p in range(n_trend)]
+    if model=='harmonic':
+        for k in range(1, n_harmonics+1):
+            columns += [np.sin(2*np.pi*k*t), np.cos(2*np.pi*k*t)]
+    return np.stack(columns, axis=1), n_trend
+
+
+def fit_trends(times, species, start=None, end=None, model='linear', n_harmonics=4):
+    """ Trend fits of several species sampled at the same times
+    Only samples with start <= time < end are used and returned. Each
+    species' NaNs are left out of its own fit.
+    inputs:
+        times (np.array): datetime64 (or datetime) sample times
+        species (dict): name -> values at times
+        start (datetime64/datetime/str): start date, also t=0 of the fit
+                                         (default: first sample)
+        end (datetime64/datetime/str): end date (default: after the last sample)
+        model (str): 'linear', 'quadratic' or 'harmonic'
+        n_harmonics (int): annual harmonics of the 'harmonic' model
+
+    returns:
+        trends (dict): 'time' plus, for each species name:
+            - name+'_coefs': fitted coefficients (trend columns first)
+            - name+'_trend': polynomial trend
+            - name+'_fit': full fit (trend plus harmonics)
+            - name+'_detrended': values minus the trend's change since
+                                 start, i.e. seasonal cycle and residual
+                                 around the start level
+            - name+'_residual': values minus the full fit
+    """
+    times = np.asarray(times, dtype='datetime64[m]')
+    keep = ~np.isnat(times)
+    if start is None:
+        start = times[keep].min()
+    keep &= times>=np.datetime64(start, 'm')
+    if end is not None:
+        keep &= times<np.datetime64(end, 'm')
+    times = times[keep]
+    names = list(species)
+    values = np.stack([np.asarray(species[name], dtype=float)[keep] for name in names])
+
+    A, n_trend = design_matrix(decimal_years(times, start), model, n_harmonics)
+    valid = np.isfinite(values)
+    filled = np.where(valid, values, 0.)
+#   Normal equations of every species at once: (nspecies, ncoefs, ncoefs)
+    normal = np.einsum('sn,ni,nj->sij', valid.astype(float), A, A)
+    rhs = np.einsum('sn,ni->si', filled, A)
+    coefs = np.linalg.solve(normal, rhs[..., None])[..., 0]
+
+    fit = coefs.dot(A.T)
+    trend = coefs[:, :n_trend].dot(A[:, :n_trend].T)
+    trends = {'time': times}
+    for i, name in enumerate(names):
+        trends[name+'_coefs'] = coefs[i]
+        trends[name+'_trend'] = trend[i]
+        trends[name+'_fit'] = fit[i]
+        trends[name+'_detrended'] = values[i]-(trend[i]-coefs[i, 0])
+        trends[name+'_residual'] = values[i]-fit[i]
+    return trends
+
+
+def data_digest(times, species):
+    """ sha1 hex digest of the times and species values being fitted
+    """
+    digest = hashlib.sha1(np.ascontiguousarray(times, dtype='datetime64[us]').tobytes())
+    for name in sorted(species):
+        digest.update(name.encode('utf-8')+b'|')
+        digest.update(np.ascontiguousarray(species[name], dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def cached_trends(cache_dir, datapath, times, species, start=None, end=None,
+                  model='linear', n_harmonics=4, tag=''):
+    """ fit_trends, cached against the source data file
+    The cache entry is rebuilt when the source file changes, the fit
+    parameters differ or the times and species values being fitted
+    differ (data_digest), so any selection or processing change after
+    reading the file also gives a new entry.
+    inputs:
+        cache_dir (str): root cache directory (None: no cache)
+        datapath (str): source data file the species were read from
+        tag (str): optional label of the cache entry (e.g. 'afternoon')
+        other inputs: see fit_trends
+
+    returns:
+        trends (dict): see fit_trends (memory-mapped on a cache hit)
+    """
+    loader = lambda path: fit_trends(times, species, start, end, model, n_harmonics)
+    if cache_dir is None:
+        return loader(datapath)
+    tag = 'trends|%s|%s|%s|%s|%s|%d|%s' % (tag, ','.join(sorted(species)), start, end, model,
+                                           n_harmonics, data_digest(times, species))
+    return column_cache.cached_columns(cache_dir, datapath, loader, tag=tag)
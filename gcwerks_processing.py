@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Species-agnostic processing of GCWerks 20-min averaged output.
+# What differs between species and file formats is kept in two specs:
+# - SPECIES: GCWerks columns, water correction and scale factor
+# - FORMATS: reader layout, time columns/format and per-species
+#   range filters
+# CH4 and CO2 (and their isotopes) are processed from a single parse
+# of the file; the air mask and sample times are computed once.
+# *********************************************************************
+
+import numpy as np
+
+import utils
+import gcwerks_reader
+import timestamps
+
+# Carbon-13 standard values (Brandt et al. 2010)
+VPDB = 0.0111802
+VPDB_STDEV = 0.000016
+
+SPECIES = {
+    'ch4': {'conc': '12ch4_c', 'delta': 'd13ch4_c',
+#           Correct d13ch4 values using Zazzeri formula (15/9/2020)
+            'water_correction': True,
+            'scale': 1.00028},
+    'co2': {'conc': '12co2_c', 'delta': 'd13co2_c',
+#           Don't think CO2 data need correction for water - check with Giulia Zazzeri.
+#           Data on MPI-BGC scale
+            'water_correction': False,
+            'scale': None},
+}
+
+FORMATS = {
+    'space': {'layout': 'space',
+              'time_columns': ('date', 'time'),
+              'time_format': timestamps.GCWERKS,
+              'ranges': {}},
+#   Anomalous CO2 values in the comma-delimited export. NB. These need to be flagged and removed!
+    'comma': {'layout': 'comma',
+              'time_columns': ('date_time',),
+              'time_format': timestamps.GCWERKS_CSV,
+              'ranges': {'co2': (400, 1000)}},
+}
+
+
+def species_columns(species, fmt='space'):
+    """ GCWerks columns needed to process some species from a file format
+    inputs:
+        species (list): species names (keys of SPECIES)
+        fmt (str): file format (key of FORMATS)
+
+    returns:
+        columns (list): column names for gcwerks_reader
+    """
+    spec = FORMATS[fmt]
+    available = gcwerks_reader.LAYOUTS[spec['layout']]
+    available = set(available['str_cols']) | set(available['cat_cols']) | set(available['float_cols'])
+    columns = list(spec['time_columns'])+['air_type']
+    for name in species:
+        sp = SPECIES[name]
+        needed = [sp['conc'], sp['conc']+'_stdev', sp['delta'], sp['delta']+'_stdev']
+        if sp['water_correction']:
+            needed.append('h2o')
+        for column in needed:
+            if column not in available:
+                raise ValueError('%s cannot be processed from the %s format (no %s column)' % (name, fmt, column))
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def _process_species(gcwerks, name, air):
+    """ Dry-air correction and 13C addition for one species, on rows air
+    """
+    sp = SPECIES[name]
+    conc, conc_stdev = gcwerks[sp['conc']][air], gcwerks[sp['conc']+'_stdev'][air]
+    delta, delta_stdev = gcwerks[sp['delta']][air], gcwerks[sp['delta']+'_stdev'][air]
+    if sp['water_correction']:
+        correction = -0.0109*gcwerks['h2o'][air]+1.0023
+        delta = delta/correction
+        delta_stdev = delta_stdev/correction
+
+#   Compute 13C values and total (12C + 13C) concentrations
+    conc13 = VPDB*conc*(1+delta*1e-3)
+    conc13_stdev = VPDB_STDEV*conc_stdev*(1+delta_stdev*1e-3)
+#   Array x**2 squares directly where the old per-sample loop went through
+#   pow: stdevs can differ from it by 1 ulp, so compare with np.allclose
+    out = {name: conc+conc13,
+           name+'_stdev': np.sqrt(conc_stdev**2 + conc13_stdev**2),
+           'd13'+name: delta,
+           'd13'+name+'_stdev': delta_stdev}
+    if sp['scale'] is not None:
+        for key in out:
+            out[key] = out[key]*sp['scale']
+    return out
+
+
+def species_from_gcwerks(gcwerks, species=('ch4', 'co2'), fmt='space', sample='air'):
+    """ Process several species from one set of parsed GCWerks columns
+    Only outdoor air samples are kept by default (or the samples of a
+    standard tank), inside the format's range filters; each species gets
+    its own sample times.
+    inputs:
+        gcwerks (dict): columns from gcwerks_reader (species_columns)
+        species (list): species names (keys of SPECIES)
+        fmt (str): file format (key of FORMATS)
+        sample (str): sample type to keep ('air' or a tank name, e.g. 'D671527')
+
+    returns:
+        processed (dict): species name -> dict with 'time' (datetime64[m]),
+                          conc, conc stdev, d13 and d13 stdev
+                          (e.g. 'ch4', 'ch4_stdev', 'd13ch4', 'd13ch4_stdev')
+    """
+    spec = FORMATS[fmt]
+#   Sample rows and their times, shared by all species
+    air = np.flatnonzero(utils.sample_mask(gcwerks['air_type'], sample,
+                                           gcwerks.get('air_type_categories')))
+    if len(spec['time_columns'])==2:
+        date, time = [gcwerks[column][air] for column in spec['time_columns']]
+        air_times = timestamps.gcwerks_timestamps(date, time)
+    else:
+        air_times = timestamps.parse_timestamps(gcwerks[spec['time_columns'][0]][air], spec['time_format'])
+
+    processed = {}
+    for name in species:
+        rows, times = air, air_times
+        if name in spec['ranges']:
+            low, high = spec['ranges'][name]
+            conc = gcwerks[SPECIES[name]['conc']][air]
+            inside = (conc>low) & (conc<high)
+            rows, times = air[inside], air_times[inside]
+        species_dict = {'time': times}
+        species_dict.update(_process_species(gcwerks, name, rows))
+        processed[name] = species_dict
+    return processed
+
+
+def process_gcwerks(gcwerks_datapath, species=('ch4', 'co2'), fmt='space', cache_dir=None):
+    """ Read a GCWerks file once and process several species from it
+    inputs:
+        gcwerks_datapath (str): path to GCWerks 20-min ave file
+        species (list): species names (keys of SPECIES)
+        fmt (str): file format, 'space' or 'comma' (key of FORMATS)
+        cache_dir (str): directory for cached parsed columns (None: no cache)
+
+    returns:
+        processed (dict): see species_from_gcwerks
+    """
+    gcwerks = gcwerks_reader.read_gcwerks(gcwerks_datapath,
+                                          layout=FORMATS[fmt]['layout'],
+                                          columns=species_columns(species, fmt),
+                                          cache_dir=cache_dir)
+    return species_from_gcwerks(gcwerks, species, fmt)
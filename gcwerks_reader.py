@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Single-pass reader for GCWerks 20-min averaged output files.
+# The file is tokenized once and the requested columns are returned
+# as typed NumPy arrays, replacing the repeated np.genfromtxt calls
+# (one per column group) used in the processing scripts.
+# Categorical columns (the sample type) are returned as small integer
+# codes plus a lookup table of categories, name+'_categories'.
+# *********************************************************************
+
+import numpy as np
+
+import column_cache
+
+# Column layouts of the GCWerks exports used at ICL
+#   - 'space': space-delimited full record (CH4 and CO2)
+#   - 'comma': comma-delimited CO2 export
+LAYOUTS = {
+    'space': {
+        'delimiter': None,
+        'skip_header': 2,
+        'str_cols': {'date': 2, 'time': 3},
+        'cat_cols': {'air_type': 5},
+        'float_cols': {'h2o': 10,
+                       'd13ch4_c': 11, 'd13ch4_c_stdev': 14,
+                       'd13co2_c': 16, 'd13co2_c_stdev': 19,
+                       '12ch4_c': 21, '12ch4_c_stdev': 24,
+                       '12co2_c': 26, '12co2_c_stdev': 29},
+    },
+    'comma': {
+        'delimiter': ',',
+        'skip_header': 1,
+        'str_cols': {'date_time': 1},
+        'cat_cols': {'air_type': 2},
+        'float_cols': {'d13co2_c': 14, 'd13co2_c_stdev': 17,
+                       '12co2_c': 24, '12co2_c_stdev': 27},
+    },
+}
+
+
+# Bumped when the cached column types change (2: categorical sample type)
+CACHE_VERSION = 2
+
+
+def _to_float(tokens):
+    """ Convert a list of string tokens to float64
+    Unparseable entries become NaN (as with np.genfromtxt)
+    """
+    try:
+        return np.array(tokens, dtype=float)
+    except ValueError:
+        out = np.empty(len(tokens))
+        for i, token in enumerate(tokens):
+            try:
+                out[i] = float(token)
+            except ValueError:
+                out[i] = np.nan
+        return out
+
+
+def encode_categories(tokens):
+    """ Encode string tokens as integer codes into a table of categories
+    inputs:
+        tokens (list): string tokens
+
+    returns:
+        codes (np.array): smallest unsigned integer type that fits
+        categories (np.array): sorted unique strings; token i is categories[codes[i]]
+    """
+    categories, codes = np.unique(np.array(tokens, dtype=str), return_inverse=True)
+    return codes.astype(np.min_scalar_type(max(len(categories)-1, 0))), categories
+
+
+def output_columns(layout, columns=None):
+    """ Names of the arrays returned for some columns (adds the lookup
+    tables of categorical columns)
+    """
+    spec = LAYOUTS[layout]
+    if columns is None:
+        columns = list(spec['str_cols'])+list(spec['cat_cols'])+list(spec['float_cols'])
+    names = []
+    for name in columns:
+        names.append(name)
+        if name in spec['cat_cols']:
+            names.append(name+'_categories')
+    return names
+
+
+def tokenize_lines(lines, layout, columns=None):
+    """ Convert data lines of a GCWerks file to typed columns
+    inputs:
+        lines (list): data lines (header already removed)
+        layout (str): key in LAYOUTS
+        columns (list): column names to return (default: all in layout)
+
+    returns:
+        data (dict): column name -> np.array (see read_gcwerks)
+    """
+    spec = LAYOUTS[layout]
+    delimiter = spec['delimiter']
+    col_index = dict(spec['str_cols'], **spec['float_cols'])
+    col_index.update(spec['cat_cols'])
+    if columns is None:
+        columns = list(col_index)
+
+    lines = [line for line in lines if line.strip()]
+    nrows = len(lines)
+    data = {}
+    if nrows == 0:
+        for name in columns:
+            if name in spec['cat_cols']:
+                data[name], data[name+'_categories'] = encode_categories([])
+            else:
+                data[name] = np.array([], dtype=str if name in spec['str_cols'] else float)
+        return data
+
+    if delimiter is None:
+        ncols = len(lines[0].split())
+        tokens = ' '.join(lines).split()
+    else:
+        ncols = len(lines[0].split(delimiter))
+        tokens = delimiter.join(lines).split(delimiter)
+
+    if len(tokens) == nrows*ncols:
+#     Regular file: every column is a strided slice of the token list
+        def column(ind):
+            return tokens[ind::ncols]
+    else:
+#     Ragged rows: fall back to splitting line by line
+        rows = [line.split(delimiter) for line in lines]
+        def column(ind):
+            return [row[ind] for row in rows]
+
+    for name in columns:
+        ind = col_index[name]
+        if name in spec['str_cols']:
+            data[name] = np.array(column(ind), dtype=str)
+        elif name in spec['cat_cols']:
+            data[name], data[name+'_categories'] = encode_categories(column(ind))
+        else:
+            data[name] = _to_float(column(ind))
+    return data
+
+
+def read_gcwerks(gcwerks_datapath, layout='space', columns=None, cache_dir=None):
+    """ Read a GCWerks 20-min averaged file in a single pass
+    inputs:
+        gcwerks_datapath (str): path to GCWerks 20-min ave file
+        layout (str): 'space' (space-delimited) or 'comma' (comma-delimited)
+        columns (list): column names to return (default: all in layout)
+        cache_dir (str): if given, parsed columns are cached here as .npy
+                         files and reused until the source file changes
+
+    returns:
+        data (dict): column name -> np.array (str, float64 or integer
+                     codes with a name+'_categories' lookup table)
+    """
+    if cache_dir is not None:
+        data = column_cache.cached_columns(cache_dir, gcwerks_datapath,
+                                           lambda path: read_gcwerks(path, layout),
+                                           tag='gcwerks_%s_%s' % (CACHE_VERSION, layout))
+        if columns is None:
+            return data
+        return {name: data[name] for name in output_columns(layout, columns)}
+
+    with open(gcwerks_datapath, 'r') as handle:
+        lines = handle.read().splitlines()
+    return tokenize_lines(lines[LAYOUTS[layout]['skip_header']:], layout, columns)
+
+
+def iter_gcwerks_blocks(gcwerks_datapath, offset=0, layout='space', columns=None, block_rows=50000):
+    """ Stream a GCWerks file in blocks of rows
+    Only one block of text and columns is held in memory at a time.
+    Only complete (newline-terminated) rows are read.
+    inputs:
+        gcwerks_datapath (str): path to GCWerks 20-min ave file
+        offset (int): byte offset to start from (0: start of file, header skipped)
+        layout (str): 'space' (space-delimited) or 'comma' (comma-delimited)
+        columns (list): column names to return (default: all in layout)
+        block_rows (int): number of rows per block
+
+    yields:
+        data (dict): column name -> np.array for the rows of one block
+        end_offset (int): byte offset just past the last row of the block
+    """
+    with open(gcwerks_datapath, 'rb') as handle:
+        handle.seek(offset)
+        if offset==0:
+            for _ in range(LAYOUTS[layout]['skip_header']):
+                offset += len(handle.readline())
+        block = []
+        for line in handle:
+            if not line.endswith(b'\n'):
+                break
+            block.append(line)
+            if len(block)==block_rows:
+                offset += sum(len(row) for row in block)
+                yield tokenize_lines(b''.join(block).decode('utf-8', 'replace').splitlines(),
+                                     layout, columns), offset
+                block = []
+        if block:
+            offset += sum(len(row) for row in block)
+            yield tokenize_lines(b''.join(block).decode('utf-8', 'replace').splitlines(),
+                                 layout, columns), offset
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Put irregularly timed samples onto a regular time grid (20-min by
+# default). Slot indices are computed with datetime64 arithmetic and
+# every variable is scattered onto the grid in one operation.
+# *********************************************************************
+
+import numpy as np
+
+
+def _step(step_minutes):
+    return np.timedelta64(int(step_minutes), 'm')
+
+
+def regular_grid(start, end, step_minutes=20):
+    """ Regular time grid [start, end)
+    inputs:
+        start, end (datetime64/datetime/str): grid limits
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        grid_times (np.array): datetime64[m] slot start times
+    """
+    return np.arange(np.datetime64(start, 'm'), np.datetime64(end, 'm'), _step(step_minutes))
+
+
+def grid_slots(times, start, step_minutes=20):
+    """ Index of the grid slot containing each time
+    A time t falls in slot floor((t-start)/step), i.e. a 20-min grid puts
+    minutes 00-19 in the first slot of the hour, 20-39 in the second, etc.
+    inputs:
+        times (np.array): datetime64 (or datetime) sample times
+        start (datetime64/datetime/str): start of the grid
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        slots (np.array): int64 slot indices (may be <0 or beyond the grid end)
+    """
+    minutes = (np.asarray(times, dtype='datetime64[m]')-np.datetime64(start, 'm')).astype(np.int64)
+    return minutes//int(step_minutes)
+
+
+def grid_record(times, variables, start=None, end=None, step_minutes=20):
+    """ Scatter samples onto a regular time grid
+    Slots without a sample are NaN. If several samples fall in the same
+    slot the last one is kept. Samples outside [start, end) are dropped.
+    inputs:
+        times (np.array): datetime64 (or datetime) sample times
+        variables (dict): name -> 1D array of sample values
+        start (datetime64/datetime/str): start of the grid
+                                         (default: midnight before the first sample)
+        end (datetime64/datetime/str): end of the grid
+                                       (default: midnight after the last sample)
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        grid_times (np.array): datetime64[m] slot start times
+        gridded (dict): name -> float64 array on the grid
+    """
+    times = np.asarray(times, dtype='datetime64[m]')
+    finite = ~np.isnat(times)
+    if (start is None or end is None) and not np.any(finite):
+        raise ValueError('Grid start and end are needed when there are no sample times')
+    if start is None:
+        start = times[finite].min().astype('datetime64[D]')
+    if end is None:
+        end = times[finite].max().astype('datetime64[D]')+np.timedelta64(1, 'D')
+    grid_times = regular_grid(start, end, step_minutes)
+
+    slots = grid_slots(times, start, step_minutes)
+    valid = np.flatnonzero(finite & (slots>=0) & (slots<len(grid_times)))
+#     Keep the last sample of any slot with several samples
+    unique_rev, first_rev = np.unique(slots[valid][::-1], return_index=True)
+    valid = valid[len(valid)-1-first_rev]
+    slots = unique_rev
+
+    gridded = {}
+    for name, values in variables.items():
+        out = np.full(len(grid_times), np.nan)
+        out[slots] = np.asarray(values, dtype=float)[valid]
+        gridded[name] = out
+    return grid_times, gridded
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Group time series data by calendar month.
+# Samples get a month key (months since 1970-01, i.e. year*12+month up
+# to a constant), are sorted once, and each month is then an offset
+# range of the sorted array. Works for any date range.
+# *********************************************************************
+
+import numpy as np
+
+
+def month_keys(times):
+    """ Month key of each time: (year-1970)*12+(month-1)
+    """
+    return np.asarray(times, dtype='datetime64[M]').astype(np.int64)
+
+
+def _month_range(keys, start, end):
+    """ Month keys from start to end, and the first/last key of the range
+    The range is empty (and matches no sample) without data and without
+    start/end, or if start is after end.
+    """
+    if (start is None or end is None) and len(keys)==0:
+        return np.array([], dtype=np.int64), 0, -1
+    if start is None:
+        start = keys.min()
+    else:
+        start = np.datetime64(start, 'M').astype(np.int64)
+    if end is None:
+        end = keys.max()
+    else:
+        end = np.datetime64(end, 'M').astype(np.int64)
+    month_range = np.arange(start, end+1)
+    if len(month_range)==0:
+        return month_range, 0, -1
+    return month_range, month_range[0], month_range[-1]
+
+
+def group_by_month(times, values, start=None, end=None):
+    """ Sort samples by month and find each month's offset range
+    Samples keep their original order within a month.
+    inputs:
+        times (np.array): datetime64 (or datetime) sample times
+        values (np.array): sample values
+        start, end (datetime64/datetime/str): first and last month
+                                              (default: months of the data)
+
+    returns:
+        months (np.array): datetime64[M] months from start to end
+        offsets (np.array): month i is sorted_values[offsets[i]:offsets[i+1]]
+        sorted_values (np.array): values sorted by month
+    """
+    keys = month_keys(times)
+    values = np.asarray(values)
+    month_range, first, last = _month_range(keys, start, end)
+
+    inside = (keys>=first) & (keys<=last)
+    keys, values = keys[inside], values[inside]
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    offsets = np.searchsorted(sorted_keys, np.append(month_range, last+1), side='left')
+    return month_range.astype('datetime64[M]'), offsets, values[order]
+
+
+def month_slices(times, values, start=None, end=None):
+    """ List of per-month arrays (views into one sorted array)
+    inputs:
+        see group_by_month
+
+    returns:
+        months (np.array): datetime64[M] months from start to end
+        slices (list): one array of values per month
+    """
+    months, offsets, sorted_values = group_by_month(times, values, start, end)
+    return months, [sorted_values[offsets[i]:offsets[i+1]] for i in range(len(months))]
+
+
+def monthly_stats(times, values, start=None, end=None, percentiles=(25, 50, 75)):
+    """ Per-month count, mean and percentiles, ignoring NaNs
+    Percentiles use linear interpolation (as np.percentile).
+    inputs:
+        times (np.array): datetime64 (or datetime) sample times
+        values (np.array): sample values
+        start, end (datetime64/datetime/str): first and last month
+        percentiles (tuple): percentiles to compute (0-100)
+
+    returns:
+        stats (dict): 'month' (datetime64[M]), 'count', 'mean', and
+                      'p<q>' for each percentile q (e.g. 'p50' = median);
+                      NaN for months without data
+    """
+    keys = month_keys(times)
+    values = np.asarray(values, dtype=float)
+    month_range, first, last = _month_range(keys, start, end)
+
+    keep = ~np.isnan(values) & (keys>=first) & (keys<=last)
+    keys, values = keys[keep], values[keep]
+#   One sort by (month, value): each month is then a sorted run
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    offsets = np.searchsorted(keys, np.append(month_range, last+1), side='left')
+    count = np.diff(offsets)
+    has_data = count>0
+
+    stats = {'month': month_range.astype('datetime64[M]'), 'count': count}
+    sums = np.add.reduceat(values, offsets[:-1][has_data]) if len(values) else np.array([])
+    mean = np.full(len(month_range), np.nan)
+    mean[has_data] = sums/count[has_data]
+    stats['mean'] = mean
+
+    for q in percentiles:
+        pos = offsets[:-1][has_data]+q/100.*(count[has_data]-1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        out = np.full(len(month_range), np.nan)
+        out[has_data] = values[lo]+(values[hi]-values[lo])*(pos-lo)
+        stats['p%g' % q] = out
+    return stats
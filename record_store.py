@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# On-disk store for processed measurement records (dicts of equal
+# length 1D arrays with a 'time' key).
+# - 'hdf5': one chunked, resizable dataset per variable; time (and any
+#   other datetime64 variable) is stored as int64 datetime64 ticks.
+#   Masked arrays are stored as their data plus a boolean name+'.mask'
+#   dataset. Records can be appended to and read back
+#   for a time range without loading the whole file.
+# - 'pickle': legacy format (whole dict pickled).
+# *********************************************************************
+
+import os
+import bisect
+import pickle
+import numpy as np
+import h5py
+
+CHUNK_ROWS = 4096
+
+MASK_SUFFIX = '.mask'
+
+
+def infer_format(store_path):
+    """ 'pickle' for .pickle/.pkl files, 'hdf5' otherwise
+    """
+    if os.path.splitext(store_path)[1] in ('.pickle', '.pkl'):
+        return 'pickle'
+    return 'hdf5'
+
+
+def _time_unit(times):
+    """ datetime64 unit of a time array (object arrays are stored in minutes)
+    """
+    times = np.asarray(times)
+    if times.dtype.kind=='M':
+        return np.datetime_data(times.dtype)[0]
+    return 'm'
+
+
+def _split_masks(record):
+    """ Masked arrays -> data plus a name+'.mask' boolean variable
+    """
+    out = {}
+    for key, values in record.items():
+        if np.ma.isMaskedArray(values):
+            out[key] = np.ma.getdata(values)
+            out[key+MASK_SUFFIX] = np.ma.getmaskarray(values)
+        else:
+            out[key] = values
+    return out
+
+
+def _write_hdf5(store_path, record, chunk_rows, compression):
+    with h5py.File(store_path, 'w') as store:
+        for key, values in _split_masks(record).items():
+            units = None
+            if key=='time' or np.asarray(values).dtype.kind=='M':
+                units = 'datetime64[%s]' % _time_unit(values)
+                values = np.asarray(values, dtype=units).view(np.int64)
+            else:
+                values = np.asarray(values)
+            dset = store.create_dataset(key, data=values,
+                                        chunks=(chunk_rows,),
+                                        maxshape=(None,),
+                                        compression=compression)
+            if units is not None:
+                dset.attrs['units'] = units
+
+
+def _append_hdf5(store_path, record):
+    record = _split_masks(record)
+    with h5py.File(store_path, 'a') as store:
+        if set(store.keys())!=set(record):
+            raise ValueError('Variables do not match the store: %s' % sorted(set(store.keys())^set(record)))
+        n_old = store['time'].shape[0]
+        n_new = len(record['time'])
+        for key, values in record.items():
+            dset = store[key]
+            if 'units' in dset.attrs:
+                values = np.asarray(values, dtype=dset.attrs['units']).view(np.int64)
+            dset.resize((n_old+n_new,))
+            dset[n_old:] = values
+
+
+def _bisect(dset, value, side):
+    """ Binary search on a sorted on-disk dataset (reads O(log n) elements)
+    """
+    class _View(object):
+        def __len__(self):
+            return dset.shape[0]
+        def __getitem__(self, i):
+            return dset[i]
+    if side=='left':
+        return bisect.bisect_left(_View(), value)
+    return bisect.bisect_right(_View(), value)
+
+
+def _read_hdf5(store_path, start, end, variables):
+    with h5py.File(store_path, 'r') as store:
+        tdset = store['time']
+        units = tdset.attrs['units']
+        ticks = lambda t: np.asarray(t, dtype=units).view(np.int64)[()]
+        i0 = 0 if start is None else _bisect(tdset, ticks(start), 'left')
+        i1 = tdset.shape[0] if end is None else _bisect(tdset, ticks(end), 'left')
+        keys = [key for key in store.keys() if not key.endswith(MASK_SUFFIX)]
+        if variables is not None:
+            keys = ['time']+[v for v in variables if v!='time']
+        record = {}
+        for key in keys:
+            values = store[key][i0:i1]
+            if 'units' in store[key].attrs:
+                values = values.view(store[key].attrs['units'])
+            if key+MASK_SUFFIX in store:
+                values = np.ma.MaskedArray(values, mask=store[key+MASK_SUFFIX][i0:i1])
+            record[key] = values
+    return record
+
+
+def save_record(store_path, record, fmt=None, chunk_rows=CHUNK_ROWS, compression=None):
+    """ Write a record, replacing any existing store
+    inputs:
+        store_path (str): output path
+        record (dict): equal length 1D arrays, including 'time'
+        fmt (str): 'hdf5' or 'pickle' (default: from the file extension)
+        chunk_rows (int): rows per HDF5 chunk
+        compression (str): HDF5 compression filter (e.g. 'gzip', 'lzf')
+    """
+    fmt = fmt or infer_format(store_path)
+    if fmt=='pickle':
+        with open(store_path, 'wb') as handle:
+            pickle.dump(record, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    else:
+        _write_hdf5(store_path, record, chunk_rows, compression)
+
+
+def append_record(store_path, record, fmt=None, chunk_rows=CHUNK_ROWS):
+    """ Append rows to a store (created if it does not exist)
+    New rows must not be earlier than the last stored time.
+    inputs:
+        store_path (str): path to the store
+        record (dict): equal length 1D arrays, including 'time'
+        fmt (str): 'hdf5' or 'pickle' (default: from the file extension)
+        chunk_rows (int): rows per HDF5 chunk (new stores only)
+    """
+    fmt = fmt or infer_format(store_path)
+    if not os.path.exists(store_path):
+        save_record(store_path, record, fmt=fmt, chunk_rows=chunk_rows)
+        return
+    if len(record['time'])==0:
+        return
+    last = last_time(store_path, fmt=fmt)
+    if last is not None and np.asarray(record['time'], dtype='datetime64[m]')[0]<np.datetime64(last, 'm'):
+        raise ValueError('Appended rows start before the last stored time (%s)' % last)
+
+    if fmt=='pickle':
+#     Legacy format: the whole file has to be rewritten
+        old = load_record(store_path, fmt='pickle')
+        for key in old:
+            old[key] = np.ma.concatenate([old[key], record[key]]) if np.ma.isMaskedArray(old[key]) \
+                else np.concatenate([np.asarray(old[key]), np.asarray(record[key])])
+        save_record(store_path, old, fmt='pickle')
+    else:
+        _append_hdf5(store_path, record)
+
+
+def load_record(store_path, start=None, end=None, variables=None, fmt=None):
+    """ Read a record, optionally only rows with start <= time < end
+    inputs:
+        store_path (str): path to the store
+        start, end (datetime64/datetime/str): time range (None: open ended)
+        variables (list): variables to read (default: all); 'time' is always read
+        fmt (str): 'hdf5' or 'pickle' (default: from the file extension)
+
+    returns:
+        record (dict): variable -> np.array, time as datetime64
+                       (np.ma.MaskedArray for variables saved with a mask)
+    """
+    fmt = fmt or infer_format(store_path)
+    if fmt=='hdf5':
+        return _read_hdf5(store_path, start, end, variables)
+
+    with open(store_path, 'rb') as handle:
+        record = pickle.load(handle)
+    if start is None and end is None and variables is None:
+        return record
+    times = np.asarray(record['time'], dtype='datetime64[%s]' % _time_unit(record['time']))
+    keep = np.ones(len(times), dtype=bool)
+    if start is not None:
+        keep &= times>=np.datetime64(start)
+    if end is not None:
+        keep &= times<np.datetime64(end)
+    keys = list(record) if variables is None else ['time']+[v for v in variables if v!='time']
+    return {key: np.asanyarray(record[key])[keep] for key in keys}
+
+
+def last_time(store_path, fmt=None):
+    """ Last stored time (datetime64), or None for an empty store
+    """
+    fmt = fmt or infer_format(store_path)
+    if fmt=='hdf5':
+        with h5py.File(store_path, 'r') as store:
+            tdset = store['time']
+            if tdset.shape[0]==0:
+                return None
+            return tdset[tdset.shape[0]-1:].view(tdset.attrs['units'])[0]
+    times = load_record(store_path, fmt='pickle')['time']
+    if len(times)==0:
+        return None
+    return np.datetime64(times[-1])
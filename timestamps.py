@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Bulk conversion of timestamp string columns to datetime64 arrays.
+# Fixed-width layouts are decoded with array arithmetic on the raw
+# characters instead of calling dt.datetime.strptime row by row.
+# Layouts used at ICL:
+#   - GCWerks space-delimited:  '%y%m%d %H%M'       (date + time cols)
+#   - ClimeMet met data:        '%Y-%m-%d %H:%M:%S'
+#   - GCWerks comma-delimited:  ' %Y-%m-%d %H:%M'
+# *********************************************************************
+
+import numpy as np
+import datetime as dt
+
+GCWERKS = '%y%m%d %H%M'
+CLIMEMET = '%Y-%m-%d %H:%M:%S'
+GCWERKS_CSV = ' %Y-%m-%d %H:%M'
+
+# Character positions of each field, and separators, for fixed-width layouts
+_LAYOUTS = {
+    GCWERKS: {'length': 11,
+              'fields': {'y': (0,2), 'm': (2,4), 'd': (4,6), 'H': (7,9), 'M': (9,11)},
+              'seps': {6: ' '}},
+    CLIMEMET: {'length': 19,
+               'fields': {'Y': (0,4), 'm': (5,7), 'd': (8,10), 'H': (11,13), 'M': (14,16), 'S': (17,19)},
+               'seps': {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}},
+    GCWERKS_CSV: {'length': 17,
+                  'fields': {'Y': (1,5), 'm': (6,8), 'd': (9,11), 'H': (12,14), 'M': (15,17)},
+                  'seps': {0: ' ', 5: '-', 8: '-', 11: ' ', 14: ':'}},
+    '%y%m%d': {'length': 6,
+               'fields': {'y': (0,2), 'm': (2,4), 'd': (4,6)},
+               'seps': {}},
+    '%H%M': {'length': 4,
+             'fields': {'H': (0,2), 'M': (2,4)},
+             'seps': {}},
+}
+
+# Formats tried (in order) when no format is given
+AUTO_FORMATS = [GCWERKS, CLIMEMET, GCWERKS_CSV]
+
+
+def _char_matrix(strings, length):
+    """ View a string column as an (n, length) array of character codes
+    Returns None if the strings are not all ASCII with the given length
+    """
+    strings = np.asarray(strings)
+    if strings.dtype.kind not in ('U', 'S'):
+        strings = strings.astype(str)
+    if not np.all(np.char.str_len(strings)==length):
+        return None
+    try:
+        raw = strings.astype('S%d' % length)
+    except UnicodeEncodeError:
+        return None
+    return raw.view(np.uint8).reshape(len(raw), length)
+
+
+def _matches(chars, layout):
+    """ True if every row has digits and separators where the layout expects
+    """
+    for pos, sep in layout['seps'].items():
+        if not np.all(chars[:, pos]==ord(sep)):
+            return False
+    for start, stop in layout['fields'].values():
+        block = chars[:, start:stop]
+        if not np.all((block>=48) & (block<=57)):
+            return False
+    return True
+
+
+def _field(chars, start, stop):
+    """ Integer value of the digits in columns start:stop
+    """
+    value = np.zeros(len(chars), dtype=np.int64)
+    for k in range(start, stop):
+        value = value*10+(chars[:, k].astype(np.int64)-48)
+    return value
+
+
+def _compose(chars, layout, unit):
+    """ Build datetime64 values from the decoded fields
+    Returns None if any field is out of range (left to strptime to report)
+    """
+    fields = layout['fields']
+    n = len(chars)
+
+    def get(key, default):
+        if key in fields:
+            return _field(chars, *fields[key])
+        return np.full(n, default, dtype=np.int64)
+
+    if 'Y' in fields:
+        year = get('Y', 1970)
+    elif 'y' in fields:
+#     Same pivot as strptime's %y: 69-99 -> 19xx, 00-68 -> 20xx
+        year = get('y', 70)
+        year = np.where(year<69, year+2000, year+1900)
+    else:
+        year = np.full(n, 1970, dtype=np.int64)
+    month, day = get('m', 1), get('d', 1)
+    hour, minute, second = get('H', 0), get('M', 0), get('S', 0)
+
+    if np.any((month<1) | (month>12) | (day<1) | (hour>23) | (minute>59) | (second>61)):
+        return None
+
+    months = ((year-1970)*12+(month-1)).astype('datetime64[M]')
+    days = months.astype('datetime64[D]')+(day-1).astype('timedelta64[D]')
+#     Day beyond the end of its month (e.g. 31 Apr)
+    if np.any(days.astype('datetime64[M]')!=months):
+        return None
+    seconds = (hour*3600+minute*60+second).astype('timedelta64[s]')
+    return (days.astype('datetime64[s]')+seconds).astype('datetime64[%s]' % unit)
+
+
+def _fast_parse(strings, fmt, unit):
+    """ Decode a fixed-width layout with array arithmetic
+    Returns None if the column does not fit the layout
+    """
+    if fmt not in _LAYOUTS:
+        return None
+    layout = _LAYOUTS[fmt]
+    chars = _char_matrix(strings, layout['length'])
+    if chars is None or not _matches(chars, layout):
+        return None
+    return _compose(chars, layout, unit)
+
+
+def detect_format(strings):
+    """ Detect which of the ICL timestamp layouts a string column uses
+    inputs:
+        strings (np.array): timestamp strings
+
+    returns:
+        fmt (str): strptime format of the detected layout (None if unknown)
+    """
+    for fmt in AUTO_FORMATS:
+        layout = _LAYOUTS[fmt]
+        chars = _char_matrix(strings, layout['length'])
+        if chars is not None and _matches(chars, layout):
+            return fmt
+    return None
+
+
+def parse_timestamps(strings, fmt=None, unit='m'):
+    """ Convert a column of timestamp strings to datetime64 in bulk
+    inputs:
+        strings (np.array): timestamp strings
+        fmt (str): strptime format (detected from the data if None)
+        unit (str): datetime64 unit of the output (default minutes)
+
+    returns:
+        times (np.array): datetime64[unit] array
+    """
+    strings = np.asarray(strings)
+    if len(strings)==0:
+        return np.array([], dtype='datetime64[%s]' % unit)
+    if fmt is None:
+        fmt = detect_format(strings)
+        if fmt is None:
+            raise ValueError("Unrecognised timestamp layout, e.g. '%s'" % strings[0])
+
+    times = _fast_parse(strings, fmt, unit)
+    if times is not None:
+        return times
+
+#     Irregular or unknown layout: fall back to strptime row by row
+    return np.array([dt.datetime.strptime(s, fmt) for s in strings],
+                    dtype='datetime64[%s]' % unit)
+
+
+def gcwerks_timestamps(date, time, unit='m'):
+    """ Combine GCWerks date ('%y%m%d') and time ('%H%M') columns
+    inputs:
+        date (np.array): GCWerks date strings
+        time (np.array): GCWerks time strings
+        unit (str): datetime64 unit of the output (default minutes)
+
+    returns:
+        times (np.array): datetime64[unit] array
+    """
+    days = _fast_parse(date, '%y%m%d', unit)
+    time_of_day = _fast_parse(time, '%H%M', unit)
+    if days is not None and time_of_day is not None:
+        return days+(time_of_day-np.datetime64(0, unit))
+    joined = np.char.add(np.char.add(np.asarray(date, dtype=str), ' '), np.asarray(time, dtype=str))
+    return parse_timestamps(joined, GCWERKS, unit=unit)
@@ -13,12 +13,63 @@ import os
 import sys
 import numpy as np
 
+def nearest_inds(times, met_times, tolerance=1200):
+  """ Finds nearest met data index for every 20-min data time
+  inputs:
+      times (np.array): datetime64 times of the 20-min data
+      met_times (np.array): datetime64 times of the met data
+      tolerance (float): max. allowed time difference (s)
+
+  returns:
+      inds (np.array): index into met_times nearest to each time
+      mask (np.array): True where the nearest met time is within tolerance
+  """
+  times = np.asarray(times, dtype='datetime64[us]')
+  met_times = np.asarray(met_times, dtype='datetime64[us]')
+  if len(met_times)==0:
+    return np.zeros(len(times), dtype=int), np.zeros(len(times), dtype=bool)
+
+  order = np.argsort(met_times, kind='mergesort')
+  sorted_met = met_times[order]
+
+#   Candidates either side of each time in the sorted met record
+  right = np.searchsorted(sorted_met, times, side='left')
+  left = np.clip(right-1, 0, len(sorted_met)-1)
+  right = np.clip(right, 0, len(sorted_met)-1)
+
+  diff_left = np.abs((times-sorted_met[left]).astype(np.int64))
+  diff_right = np.abs((sorted_met[right]-times).astype(np.int64))
+  nearest = np.where(diff_right<diff_left, right, left)
+
+  inds = order[nearest]
+  mask = np.minimum(diff_left, diff_right) < tolerance*1e6
+  return inds, mask
+
 def nearest_ind(items, pivot):
   """ Finds nearest data value correpsonding to 20-min data
   """
-  time_diff = np.abs([date - pivot for date in items])
-  ind_min = time_diff.argmin(0)
-  if time_diff[ind_min].total_seconds() < 1200:
-    return [time_diff.argmin(0)]
+  inds, mask = nearest_inds(np.array([pivot], dtype='datetime64[us]'),
+                            np.array(items, dtype='datetime64[us]'))
+  if mask[0]:
+    return [inds[0]]
   else:
     return []
+
+def sample_mask(air_type, sample='air', categories=None):
+  """ Boolean mask of rows whose GCWerks sample type contains sample
+  inputs:
+      air_type (np.array): GCWerks sample type strings, or integer codes
+                           into categories (as from gcwerks_reader)
+      sample (str): sample name, e.g. 'air' or 'D671527'
+      categories (np.array): lookup table of the codes
+
+  returns:
+      mask (np.array): True where sample is in air_type
+  """
+  if categories is None:
+    return np.char.find(np.asarray(air_type, dtype=str), sample)>=0
+#   Substring test on the (small) lookup table only, then one comparison per row
+  matching =np.flatnonzero(np.char.find(np.asarray(categories, dtype=str), sample)>=0)
+  if len(matching)==1:
+    return np.asarray(air_type)==matching[0]
+  return np.isin(air_type, matching)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# *********************************************************************
+# Author: Eric Saboya, Dept. of Physics, Imperial College London
+# Contact: ericsaboya54@gmail.com
+# *********************************************************************
+# About:
+# Time-of-day window selection (e.g. 13:00-17:00 afternoon data used
+# for Keeling plots, or night-time windows).
+# Windows are [start_hour, end_hour) in local file time; a window with
+# start_hour > end_hour wraps past midnight (e.g. 22-4).
+# - hour_window_mask: boolean mask for any datetime64 times
+# - grid_window_view: strided (ndays, nslots) view of a day-aligned
+#   regular grid, no data copied
+# *********************************************************************
+
+import numpy as np
+
+
+def minute_of_day(times):
+    """ Minutes since midnight of datetime64 (or datetime) times
+    """
+    times = np.asarray(times, dtype='datetime64[m]')
+    return (times-times.astype('datetime64[D]')).astype(np.int64)
+
+
+def _in_window(minutes, start_hour, end_hour):
+    start, end = start_hour*60, end_hour*60
+    if start<=end:
+        return (minutes>=start) & (minutes<end)
+    return (minutes>=start) | (minutes<end)
+
+
+def hour_window_mask(times, start_hour, end_hour):
+    """ Mask of times within a time-of-day window
+    inputs:
+        times (np.array): datetime64 (or datetime) times
+        start_hour (float): window start (hours, inclusive)
+        end_hour (float): window end (hours, exclusive); wraps if < start_hour
+
+    returns:
+        mask (np.array): True for times inside the window
+    """
+    return _in_window(minute_of_day(times), start_hour, end_hour)
+
+
+def window_masks(times, windows):
+    """ Masks for several time-of-day windows (time of day computed once)
+    inputs:
+        times (np.array): datetime64 (or datetime) times
+        windows (dict): name -> (start_hour, end_hour)
+
+    returns:
+        masks (dict): name -> boolean mask
+    """
+    minutes = minute_of_day(times)
+    return {name: _in_window(minutes, start, end) for name, (start, end) in windows.items()}
+
+
+def grid_window_mask(n_slots, start_hour, end_hour, step_minutes=20):
+    """ Mask of the slots of a day-aligned regular grid inside a window
+    A slot is inside the window if it starts inside it.
+    inputs:
+        n_slots (int): grid length
+        start_hour, end_hour (float): window (see hour_window_mask)
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        mask (np.array): True for slots inside the window
+    """
+    minutes = (np.arange(n_slots)*step_minutes) % 1440
+    return _in_window(minutes, start_hour, end_hour)
+
+
+def grid_window_view(values, start_hour, end_hour, step_minutes=20):
+    """ View of the window's slots on a day-aligned regular grid
+    The grid must start at midnight and cover whole days. No data is
+    copied: writing to the view writes to values.
+    inputs:
+        values (np.array): 1D gridded values
+        start_hour, end_hour (float): window, must not wrap past midnight
+        step_minutes (int): grid spacing (minutes)
+
+    returns:
+        view (np.array): (ndays, slots in window) view of values
+    """
+    slots_per_day = 1440//step_minutes
+    if len(values) % slots_per_day:
+        raise ValueError('Grid does not cover whole days')
+    if start_hour>end_hour:
+        raise ValueError('Windows wrapping past midnight have no single view; use grid_window_mask')
+    first = int(np.ceil(start_hour*60/step_minutes))
+    last = int(np.ceil(end_hour*60/step_minutes))
+    return values.reshape(-1, slots_per_day)[:, first:last]